@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Times Wishlist parsing and resolution, DIMFormatter.write and DIMWishlist
+validation against synthetic manifests at several scales.
+
+Everything runs offline against data from benchmarks/synthetic.py, so this
+can be run in CI to catch performance regressions:
+
+    python benchmarks/bench.py --scales 50,200,1000 --json bench.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+PHASES = ("generate", "parse", "resolve", "write", "validate")
+
+
+def run_scale(workdir: str, weapons: int, seed: int) -> dict:
+    timings = dict()
+    start = time.perf_counter()
+    paths = synthetic.generate(workdir, weapons, seed)
+    timings["generate"] = time.perf_counter() - start
+
+    import d2wishlist.dim_additional as dim_additional
+    import d2wishlist.manifest as manifest
+    from d2wishlist.cli.creator import parse
+    from d2wishlist.cli.validator import DIMWishlist
+    from d2wishlist.formatter.dim import DIMFormatter
+
+    manifest.configure(paths["manifest"])
+    manifest.configure_cache()
+    dim_additional.configure(paths["additional_info"])
+    # Compile the index sidecar up front, it's a one-off cost per manifest
+    manifest.manifest.index_cursor()
+
+    output = os.path.join(workdir, "wishlist.txt")
+
+    start = time.perf_counter()
+    wl = parse(paths["wishlist"])
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    wl.resolve()
+    timings["resolve"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    DIMFormatter(wl, output).write()
+    timings["write"] = time.perf_counter() - start
+
+    # Validate with a cold definition cache, the way a fresh validator run would
+    manifest.configure_cache()
+    with open(output) as fh:
+        lines = fh.readlines()
+    start = time.perf_counter()
+    validator = DIMWishlist(output=[])
+    for line in lines:
+        validator.process_line(line)
+    timings["validate"] = time.perf_counter() - start
+
+    errors = [m for m, _ in validator.output if "Error" in m]
+    return {
+        "weapons": weapons,
+        "lines": len(lines),
+        "validation_errors": len(errors),
+        "seconds": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scales",
+        default="50,200,1000",
+        help="Comma-separated numbers of weapons to benchmark with",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="d2wishlist-bench-") as tmpdir:
+        for weapons in (int(s) for s in args.scales.split(",")):
+            workdir = os.path.join(tmpdir, str(weapons))
+            os.makedirs(workdir)
+            result = run_scale(workdir, weapons, args.seed)
+            results.append(result)
+
+            seconds = result["seconds"]
+            print(
+                f"{weapons:>6} weapons {result['lines']:>8} lines  "
+                + "  ".join(f"{p} {seconds[p]:8.3f}s" for p in PHASES)
+            )
+            if result["validation_errors"]:
+                print(f"  {result['validation_errors']} validation errors!")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Generates a synthetic Destiny 2 manifest, the d2-additional-info season data
+that goes with it, and a YAML wishlist covering its weapons, so the creator,
+validator and formatter can be exercised offline without the real manifest.
+
+The manifest has the same tables and JSON shape that d2wishlist.manifest
+reads: weapons with perk sockets pointing at randomized plug sets, common and
+enhanced perks, Adept variants, dummy items sharing weapon names, and
+collectibles whose sources map to seasons.
+
+    python benchmarks/synthetic.py OUTPUT_DIR --weapons 500
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+
+from ruamel.yaml import YAML
+
+from d2wishlist.manifest import (
+    COLLECTIBLEDEF,
+    INVITEMDEF,
+    PLUGSETDEF,
+    SOCKET_OVERRIDES,
+    sql_id,
+)
+from d2wishlist.sidecar import DUMMY_CATEGORY, WEAPON_PERKS
+
+# Weapon buckets: kinetic, energy, power
+BUCKETS = (1498876634, 2465295065, 953998645)
+SEASONS = range(20, 28)
+PERK_COLUMNS = 4
+PERKS_PER_COLUMN = 6
+PERK_POOL_SIZE = 400
+
+MANIFEST_TABLES = (INVITEMDEF, PLUGSETDEF, COLLECTIBLEDEF)
+
+
+class HashAllocator(object):
+    """Hands out unique random 32-bit hashes, including ones with the high bit set."""
+
+    def __init__(self, rnd, reserved=()):
+        self.rnd = rnd
+        self.used = set(reserved)
+
+    def __call__(self):
+        while True:
+            h = self.rnd.getrandbits(32)
+            if h and h not in self.used:
+                self.used.add(h)
+                return h
+
+
+def perk_definition(hash, name, tier):
+    return {
+        "hash": hash,
+        "displayProperties": {"name": name, "description": f"{name} does things."},
+        "inventory": {"tierType": tier, "bucketTypeHash": 0},
+        "itemType": 19,
+        "itemCategoryHashes": [],
+        "plug": {"plugCategoryHash": 7906839},
+    }
+
+
+def weapon_definition(hash, name, bucket, season, collectible, socket_entries):
+    return {
+        "hash": hash,
+        "displayProperties": {"name": name, "description": "A synthetic weapon."},
+        "inventory": {"tierType": 5, "bucketTypeHash": bucket},
+        "itemType": 3,
+        "iconWatermark": f"/common/destiny2_content/icons/season_{season}.png",
+        "collectibleHash": collectible,
+        "itemCategoryHashes": [1, 2],
+        "flavorText": "Lore " * 40,
+        "sockets": {
+            "socketCategories": [
+                {
+                    "socketCategoryHash": WEAPON_PERKS,
+                    "socketIndexes": list(range(PERK_COLUMNS)),
+                },
+                {"socketCategoryHash": 3956125808, "socketIndexes": [PERK_COLUMNS]},
+            ],
+            "socketEntries": socket_entries,
+        },
+    }
+
+
+def generate(output_dir: str, weapons: int = 100, seed: int = 0) -> dict:
+    """
+    Writes manifest.sqlite3, d2-additional-info/output/*.json and wishlist.yaml
+    into output_dir, returning their paths.
+    """
+    rnd = random.Random(seed)
+    new_hash = HashAllocator(rnd, SOCKET_OVERRIDES)
+    items = dict()
+    plugsets = dict()
+    collectibles = dict()
+    wishlist = []
+    sources = {season: new_hash() for season in SEASONS}
+
+    # Common perks, each with an enhanced (tierType 3) version
+    perks = []
+    for i in range(PERK_POOL_SIZE):
+        common = new_hash()
+        enhanced = new_hash()
+        name = f"Perk {i:04d}"
+        items[common] = perk_definition(common, name, 2)
+        items[enhanced] = perk_definition(enhanced, f"Enhanced {name}", 3)
+        perks.append((common, enhanced, name))
+
+    intrinsic = new_hash()
+    items[intrinsic] = perk_definition(intrinsic, "Intrinsic Frame", 2)
+
+    for w in range(weapons):
+        name = f"Synthetic Weapon {w:05d}"
+        bucket = BUCKETS[w % len(BUCKETS)]
+        season = SEASONS[w % len(SEASONS)]
+
+        # Every column gets its own perks, so perk names are unique per weapon
+        pool = rnd.sample(perks, PERK_COLUMNS * PERKS_PER_COLUMN)
+        socket_entries = []
+        columns = []
+        for c in range(PERK_COLUMNS):
+            column = pool[c * PERKS_PER_COLUMN : (c + 1) * PERKS_PER_COLUMN]
+            plugset = new_hash()
+            plugsets[plugset] = {
+                "hash": plugset,
+                "reusablePlugItems": [
+                    {"plugItemHash": p, "currentlyCanRoll": True}
+                    for perk in column
+                    for p in perk[:2]
+                ],
+            }
+            socket_entries.append(
+                {"reusablePlugItems": [], "randomizedPlugSetHash": plugset}
+            )
+            columns.append([perk[2] for perk in column])
+        socket_entries.append({"reusablePlugItems": [{"plugItemHash": intrinsic}]})
+
+        hashes = []
+        for suffix in ("", " (Adept)"):
+            hash = new_hash()
+            collectible = new_hash()
+            collectibles[collectible] = {
+                "hash": collectible,
+                "sourceHash": sources[season],
+            }
+            items[hash] = weapon_definition(
+                hash, f"{name}{suffix}", bucket, season, collectible, socket_entries
+            )
+            hashes.append(hash)
+
+        # A dummy item sharing the weapon's name, which variant lookups must skip
+        dummy = new_hash()
+        items[dummy] = {
+            "hash": dummy,
+            "displayProperties": {"name": name},
+            "inventory": {"tierType": 5, "bucketTypeHash": bucket},
+            "itemType": 3,
+            "itemCategoryHashes": [DUMMY_CATEGORY],
+        }
+
+        wishlist.append(
+            {
+                "name": name,
+                "hash": hashes[0],
+                "rolls": [
+                    {
+                        "tags": ["pve"],
+                        "perks": [column[:2] for column in columns],
+                        "masterwork": ["Range", "Reload"],
+                        "text": f"PvE roll for {name}.",
+                    },
+                    {
+                        "tags": ["pvp", "mkb"],
+                        "perks": [column[1:3] for column in columns],
+                        "masterwork": [],
+                        "text": f"PvP roll for {name}.",
+                    },
+                ],
+            }
+        )
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {
+        "manifest": os.path.join(output_dir, "manifest.sqlite3"),
+        "additional_info": os.path.join(output_dir, "d2-additional-info", "output"),
+        "wishlist": os.path.join(output_dir, "wishlist.yaml"),
+    }
+
+    if os.path.exists(paths["manifest"]):
+        os.remove(paths["manifest"])
+    db = sqlite3.connect(paths["manifest"])
+    for table, definitions in zip(MANIFEST_TABLES, (items, plugsets, collectibles)):
+        db.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY NOT NULL, json BLOB)")
+        db.executemany(
+            f"INSERT INTO {table} VALUES (?, ?)",
+            ((sql_id(h), json.dumps(d)) for h, d in definitions.items()),
+        )
+    db.commit()
+    db.close()
+
+    os.makedirs(paths["additional_info"], exist_ok=True)
+    season_data = {
+        "watermark-to-season.json": {
+            f"/common/destiny2_content/icons/season_{s}.png": s for s in SEASONS
+        },
+        "source-to-season-v2.json": {str(h): s for s, h in sources.items()},
+        "seasons.json": {},
+    }
+    for filename, data in season_data.items():
+        with open(os.path.join(paths["additional_info"], filename), "w") as fh:
+            json.dump(data, fh)
+
+    with open(paths["wishlist"], "w") as fh:
+        YAML().dump(
+            {
+                "title": "Synthetic Wishlist",
+                "description": f"{weapons} synthetic weapons",
+                "author": "benchmark",
+                "wishlist": wishlist,
+            },
+            fh,
+        )
+
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--weapons", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for kind, path in generate(args.output_dir, args.weapons, args.seed).items():
+        print(f"{kind}: {path}")
@@ -1,4 +1,4 @@
 if __name__ == "__main__":
-    from d2wishlist.cli import app
+    from d2wishlist.cli import main
 
-    app()
+    main()
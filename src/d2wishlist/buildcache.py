@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import pickle
+
+# Bump this whenever the rendered output format changes
+FORMAT_VERSION = 3
+
+
+class BuildCache(object):
+    """
+    Rendered DIM output blocks from previous builds, keyed by item.
+
+    Each key combines the digest of an Item's wishlist source with the
+    manifest version, season data and wishlist author, so an item is only
+    re-resolved and re-rendered when one of those changed. Entries that
+    weren't used by the current build are dropped when it's saved.
+    """
+
+    def __init__(self, path: str, *salt: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._salt = "\0".join((str(FORMAT_VERSION),) + salt)
+        self._entries = dict()
+        self._used = dict()
+
+        try:
+            with open(path, "rb") as fh:
+                self._entries = pickle.load(fh)
+        except FileNotFoundError:
+            pass
+        except (EOFError, pickle.UnpicklingError):
+            # A corrupt build cache just means a full rebuild
+            pass
+
+    def key(self, item) -> str:
+        return hashlib.sha256(
+            f"{self._salt}\0{item.source_digest()}".encode()
+        ).hexdigest()
+
+    def __contains__(self, item):
+        return self.key(item) in self._entries
+
+    def peek(self, item) -> list | None:
+        """Returns the cached blocks for item without counting it as used."""
+        return self._entries.get(self.key(item))
+
+    def get(self, item) -> list | None:
+        key = self.key(item)
+        blocks = self._entries.get(key)
+        if blocks is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used[key] = blocks
+        return blocks
+
+    def put(self, item, blocks: list):
+        key = self.key(item)
+        self._entries[key] = blocks
+        self._used[key] = blocks
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as fh:
+            pickle.dump(self._used, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Comfortably larger than the perk pool of a wishlist's worth of weapons
+DEFAULT_MAXSIZE = 16384
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS definitions (
+  tbl TEXT NOT NULL,
+  hash INTEGER NOT NULL,
+  definition BLOB NOT NULL,
+  PRIMARY KEY (tbl, hash)
+) WITHOUT ROWID
+"""
+
+
+class DefinitionCache(object):
+    """
+    An LRU cache of decoded manifest definitions, keyed by (table, hash).
+
+    If path is given, definitions are also persisted to an SQLite database at
+    that path so later runs against the same manifest version can skip the
+    manifest and the JSON decoder entirely. Definitions are read from it one
+    key at a time as they're asked for, and new ones are written back in
+    batches of up to maxsize, so the cache never holds more than that many
+    of either in memory.
+
+    All operations are safe to use from multiple threads.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, path: str = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._pending = dict()
+        self._db = None
+        self._pid = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Checks for a (table, hash) entry without touching the statistics."""
+        table, hash = key
+        key = (table, int(hash))
+        with self._lock:
+            if key in self._entries or key in self._pending:
+                return True
+            if self.path:
+                r = self._disk().execute(
+                    "SELECT 1 FROM definitions WHERE tbl = ? AND hash = ?", key
+                )
+                return r.fetchone() is not None
+            return False
+
+    def missing(self, table: str, hashes) -> list:
+        """
+        Returns the hashes without a (table, hash) entry, counting each as a
+        miss, for callers that load them in bulk and put() them afterwards.
+        """
+        with self._lock:
+            missing = [hash for hash in hashes if (table, hash) not in self]
+            self.misses += len(missing)
+            return missing
+
+    def _disk(self) -> sqlite3.Connection:
+        # Forked workers can't share the parent's connection, so each process
+        # opens its own
+        if self._db is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            try:
+                self._db = self._connect()
+            except sqlite3.OperationalError:
+                raise
+            except sqlite3.DatabaseError:
+                # Whatever is there isn't a cache we can use, so start over
+                os.remove(self.path)
+                self._db = self._connect()
+            self._pid = os.getpid()
+        return self._db
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            db.execute(SCHEMA)
+        except sqlite3.DatabaseError:
+            db.close()
+            raise
+        return db
+
+    def _load_disk(self, key):
+        r = self._disk().execute(
+            "SELECT definition FROM definitions WHERE tbl = ? AND hash = ?", key
+        )
+        row = r.fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            # A corrupt or outdated entry is just a cold one
+            return None
+
+    def get(self, table: str, hash) -> dict | None:
+        key = (table, int(hash))
+        with self._lock:
+            try:
+                definition = self._entries[key]
+            except KeyError:
+                pass
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return definition
+
+            if self.path:
+                definition = self._pending.get(key)
+                if definition is None:
+                    definition = self._load_disk(key)
+                if definition is not None:
+                    self.disk_hits += 1
+                    self._insert(key, definition)
+                    return definition
+
+            self.misses += 1
+            return None
+
+    def put(self, table: str, hash, definition: dict):
+        key = (table, int(hash))
+        with self._lock:
+            self._insert(key, definition)
+            if self.path:
+                self._pending[key] = definition
+                if len(self._pending) >= self.maxsize:
+                    self.save()
+
+    def _insert(self, key, definition):
+        self._entries[key] = definition
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self):
+        """Writes definitions added since the last save to the on-disk layer."""
+        with self._lock:
+            if not self.path or not self._pending:
+                return
+
+            db = self._disk()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO definitions VALUES (?, ?, ?)",
+                    (
+                        (
+                            table,
+                            hash,
+                            pickle.dumps(definition, pickle.HIGHEST_PROTOCOL),
+                        )
+                        for (table, hash), definition in self._pending.items()
+                    ),
+                )
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
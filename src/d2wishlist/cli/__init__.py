@@ -1,10 +1,33 @@
+import sys
+
 import typer
 
 from .creator import create
+from .differ import diff_manifest
+from .fetcher import fetch_manifest
+from .server import serve
 
 app = typer.Typer()
 app.command()(create)
+app.command("fetch-manifest")(fetch_manifest)
+app.command("diff-manifest")(diff_manifest)
+app.command()(serve)
 
+# Options of the app itself, rather than of create
+APP_OPTIONS = {"--help", "--install-completion", "--show-completion"}
 
-if __name__ == "__main__":
+
+def main():
+    """
+    Runs the app. Calls that don't start with a command, like those from
+    before there were any (d2wishlist_creator --output X FILE), run create.
+    """
+    commands = typer.main.get_command(app).commands
+    args = sys.argv[1:]
+    if args and args[0] not in commands and args[0] not in APP_OPTIONS:
+        sys.argv.insert(1, "create")
     app()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
 import typer
-from pydantic_yaml import parse_yaml_raw_as
+from ruamel.yaml import YAML
 from typing_extensions import Annotated
 
-from d2wishlist.formatter.dim import DIMFormatter
-from d2wishlist.models import Wishlist
+import d2wishlist.dim_additional as dim_additional
+import d2wishlist.manifest as manifest
+import d2wishlist.sidecar as sidecar
+from d2wishlist.buildcache import BuildCache
+from d2wishlist.cache import DEFAULT_MAXSIZE
+from d2wishlist.formatter.dim import DIMFormatter, Shard, write_all
+from d2wishlist.models import Wishlist, iter_resolve
+from d2wishlist.stats import stats
+from d2wishlist.stream import WishlistStream
 
 
 def create(
@@ -13,13 +20,198 @@ def create(
     output: Annotated[
         str, typer.Option(help="Filename to use for DIM-format wishlist output")
     ],
+    manifest_path: Annotated[
+        str,
+        typer.Option(
+            "--manifest",
+            help="Path to the Destiny 2 manifest SQLite database [default: manifest.sqlite3]",
+            envvar="D2WISHLIST_MANIFEST",
+        ),
+    ] = None,
+    additional_info: Annotated[
+        str,
+        typer.Option(
+            help="Path to d2-additional-info's generated season data [default: d2-additional-info/output]",
+            envvar="D2WISHLIST_ADDITIONAL_INFO",
+        ),
+    ] = None,
+    cache_size: Annotated[
+        int,
+        typer.Option(help="Number of decoded manifest definitions to keep in memory"),
+    ] = DEFAULT_MAXSIZE,
+    cache_dir: Annotated[
+        str,
+        typer.Option(
+            help="Directory to persist decoded manifest definitions in between runs",
+            envvar="D2WISHLIST_CACHE_DIR",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int, typer.Option(help="Number of worker processes to resolve items with")
+    ] = 1,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            help="Reuse output for items unchanged since the last build, only resolving edited ones"
+        ),
+    ] = False,
+    stream: Annotated[
+        bool,
+        typer.Option(
+            help="Resolve and write out items one at a time as they're read, keeping memory use flat"
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            help="Print time spent per phase, manifest queries and cache hit rates (not including --jobs workers)"
+        ),
+    ] = False,
+    stats_json: Annotated[
+        str,
+        typer.Option(help="Write the --profile statistics to this file as JSON"),
+    ] = None,
+    minimize: Annotated[
+        bool,
+        typer.Option(
+            help="Leave out rolls covered by an earlier roll of the same item, and notes left without any perks"
+        ),
+    ] = False,
+    shard: Annotated[
+        list[str],
+        typer.Option(
+            help="Also write the items and rolls matching FILTERS to PATH, given as PATH:FILTERS with comma-separated season=N and tag=T terms (may be repeated)"
+        ),
+    ] = None,
+    parallel_shards: Annotated[
+        bool,
+        typer.Option(
+            help="Write the output and each --shard in its own thread (not with --stream)"
+        ),
+    ] = False,
+    build_cache_path: Annotated[
+        str,
+        typer.Option(
+            "--build-cache",
+            help="File to keep the incremental build cache in [default: OUTPUT.buildcache]",
+        ),
+    ] = None,
 ):
-    print(f"Reading in YAML from {filename} and building models...")
-    with open(filename) as fh:
-        wl = parse_yaml_raw_as(Wishlist, fh.read())
+    try:
+        shards = [Shard.parse(spec) for spec in shard or []]
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--shard")
 
-    print(f"Writing out DIM wishlist to {output}...")
-    dim = DIMFormatter(wl, output)
-    dim.write()
+    manifest.configure(manifest_path)
+    manifest.configure_cache(cache_size, cache_dir)
+    dim_additional.configure(additional_info)
+
+    build(
+        filename,
+        output,
+        jobs,
+        incremental,
+        stream,
+        minimize,
+        shards,
+        parallel_shards,
+        build_cache_path,
+    )
+    stats.emit(profile, stats_json)
+
+
+def build(
+    filename: str,
+    output: str,
+    jobs: int = 1,
+    incremental: bool = False,
+    stream: bool = False,
+    minimize: bool = False,
+    shards: list = (),
+    parallel_shards: bool = False,
+    build_cache_path: str = None,
+):
+    """
+    Converts the YAML wishlist in filename to a DIM wishlist in output, using
+    whichever manifest and season data have already been configured.
+
+    This is the body of the create command, also run by serve for each job.
+    """
+    if stream:
+        print(f"Streaming YAML from {filename} out to {output}...")
+        with open(filename) as fh:
+            items = WishlistStream(fh)
+            build_cache = _build_cache(
+                incremental, build_cache_path, output, items.wishlist.author, minimize
+            )
+            # Shards need every item resolved to filter on its season and rolls
+            skip = build_cache.__contains__ if build_cache and not shards else None
+            dim = DIMFormatter(items.wishlist, output, build_cache, minimize)
+            formatters = [dim] + _shard_formatters(items.wishlist, shards, minimize)
+            with stats.phase("stream"):
+                write_all(formatters, iter_resolve(items, jobs, skip))
+    else:
+        print(f"Reading in YAML from {filename} and building models...")
+        wl = parse(filename)
+
+        build_cache = _build_cache(
+            incremental, build_cache_path, output, wl.author, minimize
+        )
+        stale = wl.wishlist
+        if build_cache and not shards:
+            stale = [item for item in wl.wishlist if item not in build_cache]
+            print(
+                f"{len(wl.wishlist) - len(stale)} items unchanged since the last build"
+            )
+
+        print("Resolving items against the manifest...")
+        with stats.phase("resolve"):
+            wl.resolve(jobs, stale)
+
+        print(f"Writing out DIM wishlist to {output}...")
+        for s in shards:
+            print(f"  and shard {s.path}...")
+        with stats.phase("write"):
+            dim = DIMFormatter(wl, output, build_cache, minimize)
+            formatters = [dim] + _shard_formatters(wl, shards, minimize)
+            write_all(formatters, threads=parallel_shards)
+
+    if minimize:
+        print(f"Minimizing removed {dim.lines_removed} lines")
+
+    manifest.definitions.save()
+    stats.add_section("definition cache", manifest.definitions.stats())
+    if build_cache:
+        build_cache.save()
+        stats.add_section(
+            "build cache", {"hits": build_cache.hits, "misses": build_cache.misses}
+        )
 
     print("Done.")
+
+
+def parse(filename: str) -> Wishlist:
+    """Reads the YAML wishlist in filename into a Wishlist."""
+    with stats.phase("parse.yaml"), open(filename) as fh:
+        data = YAML(typ="safe", pure=True).load(fh)
+    with stats.phase("parse.models"):
+        return Wishlist.model_validate(data)
+
+
+def _shard_formatters(wishlist, shards, minimize):
+    return [DIMFormatter(wishlist, s.path, minimize=minimize, shard=s) for s in shards]
+
+
+def _build_cache(incremental, path, output, author, minimize):
+    if not incremental:
+        return None
+    return BuildCache(
+        path or f"{output}.buildcache",
+        manifest.manifest.version(),
+        # Perks are written out from the sidecar's socket graph
+        str(sidecar.SCHEMA_VERSION),
+        sidecar.overrides_digest(manifest.SOCKET_OVERRIDES),
+        dim_additional.data_version(),
+        author,
+        str(minimize),
+    )
@@ -0,0 +1,45 @@
+import typer
+from ruamel.yaml import YAML
+from typing_extensions import Annotated
+
+from d2wishlist.diff import diff
+from d2wishlist.manifest import Manifest
+from d2wishlist.models import Wishlist
+
+
+def diff_manifest(
+    old: Annotated[
+        str, typer.Argument(help="Manifest the wishlist was last built with")
+    ],
+    new: Annotated[str, typer.Argument(help="Manifest to compare it against")],
+    filename: Annotated[
+        str, typer.Argument(help="Filename of YAML-formatted wishlist to check")
+    ],
+):
+    with open(filename) as fh:
+        wl = Wishlist.model_validate(YAML(typ="safe", pure=True).load(fh))
+
+    print(f"Comparing {old} to {new} for {len(wl.wishlist)} items...")
+    changes = diff(Manifest(old), Manifest(new), wl.wishlist)
+
+    for change in changes:
+        print()
+        print(f"{change.item.name} [{change.item.hashes()[0]}]")
+        if change.missing:
+            print("  no longer in the manifest")
+        for label, perks in (
+            ("perks removed", change.perks_removed),
+            ("perks added", change.perks_added),
+            ("variants removed", change.variants_removed),
+            ("variants added", change.variants_added),
+        ):
+            if perks:
+                print(
+                    f"  {label}: " + ", ".join(f"{n} [{h}]" for h, n in perks.items())
+                )
+        for roll in change.rolls:
+            print(f'  affects roll ({", ".join(roll.tags)}): "{roll.text}"')
+
+    rolls = sum(len(change.rolls) for change in changes)
+    print()
+    print(f"{len(changes)} items and {rolls} rolls affected.")
@@ -0,0 +1,68 @@
+from urllib.error import URLError
+
+import typer
+from typing_extensions import Annotated
+
+import d2wishlist.manifest as manifest
+from d2wishlist import fetch, sidecar
+
+
+def fetch_manifest(
+    manifest_path: Annotated[
+        str,
+        typer.Option(
+            "--manifest",
+            help="Where to keep the Destiny 2 manifest SQLite database [default: manifest.sqlite3]",
+            envvar="D2WISHLIST_MANIFEST",
+        ),
+    ] = None,
+    base_url: Annotated[
+        str,
+        typer.Option(
+            help="Base URL of the Bungie API and content server",
+            envvar="D2WISHLIST_BUNGIE_URL",
+        ),
+    ] = fetch.BUNGIE_URL,
+    language: Annotated[
+        str, typer.Option(help="Language of the manifest to download")
+    ] = "en",
+    timeout: Annotated[
+        float,
+        typer.Option(
+            help="Seconds to wait for the server to connect or send more data before giving up"
+        ),
+    ] = fetch.TIMEOUT,
+    force: Annotated[
+        bool,
+        typer.Option(help="Download the manifest even if the version hasn't changed"),
+    ] = False,
+    build_sidecar: Annotated[
+        bool,
+        typer.Option(
+            "--sidecar/--no-sidecar",
+            help="Compile the indexed sidecar once the manifest is up to date",
+        ),
+    ] = False,
+):
+    manifest.configure(manifest_path)
+    path = manifest.manifest.path
+
+    print(f"Checking the current manifest version at {base_url}...")
+    try:
+        version, downloaded = fetch.fetch(
+            path, base_url, language, force=force, timeout=timeout
+        )
+    except (fetch.FetchError, URLError, TimeoutError) as e:
+        print(f"Error: {e}")
+        raise typer.Exit(1)
+
+    if downloaded:
+        print(f"Fetched manifest version {version} to {path}")
+    else:
+        print(f"Manifest version {version} at {path} is already current")
+
+    if build_sidecar:
+        print("Compiling the manifest index...")
+        sidecar.ensure(path, manifest.manifest.version(), manifest.SOCKET_OVERRIDES)
+
+    print("Done.")
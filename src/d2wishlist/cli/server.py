@@ -0,0 +1,279 @@
+import io
+import ipaddress
+import json
+import threading
+from contextlib import redirect_stdout
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import typer
+from typing_extensions import Annotated
+
+import d2wishlist.dim_additional as dim_additional
+import d2wishlist.manifest as manifest
+from d2wishlist.cache import DEFAULT_MAXSIZE
+from d2wishlist.cli.creator import build
+from d2wishlist.client import DEFAULT_HOST, DEFAULT_PORT
+from d2wishlist.formatter.dim import Shard
+from d2wishlist.manifest import InventoryItem
+from d2wishlist.stats import stats
+
+# Validated items kept between validate jobs
+ITEM_CACHE_SIZE = 4096
+
+
+class JobError(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """A job that stopped on an unexpected error, with the messages it had so far."""
+
+    def __init__(self, error: Exception, messages: list):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.messages = messages
+
+
+class Server(object):
+    """
+    Keeps the manifest, its caches and the season data loaded between jobs.
+
+    Jobs run one at a time, since they share the module-level manifest,
+    definition cache and statistics. If the manifest is replaced (say by
+    fetch-manifest) everything is loaded again for the next job.
+    """
+
+    def __init__(
+        self,
+        manifest_path: str = None,
+        additional_info: str = None,
+        cache_size: int = DEFAULT_MAXSIZE,
+        cache_dir: str = None,
+    ):
+        self.manifest_path = manifest_path
+        self.additional_info = additional_info
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.version = None
+        self.jobs = 0
+        self.load()
+
+    def load(self):
+        manifest.configure(self.manifest_path)
+        manifest.configure_cache(self.cache_size, self.cache_dir)
+        dim_additional.configure(self.additional_info)
+        self.version = manifest.manifest.version()
+        self.load_item = lru_cache(maxsize=ITEM_CACHE_SIZE)(InventoryItem)
+
+        # Compile or open the sidecar and build its in-memory indexes up front
+        manifest.manifest.plug_hashes()
+        manifest.manifest.name_index()
+
+    def refresh(self):
+        """Loads everything again if the manifest has changed since the last job."""
+        if manifest.manifest_version(manifest.manifest.path) != self.version:
+            print(f"Manifest changed, reloading {manifest.manifest.path}...")
+            self.load()
+
+    def status(self) -> dict:
+        return {
+            "manifest": manifest.manifest.path,
+            "manifest_version": self.version,
+            "jobs": self.jobs,
+            "definition cache": manifest.definitions.stats(),
+            "item cache": self.load_item.cache_info()._asdict(),
+        }
+
+    def run(self, job: str, args: dict) -> dict:
+        with self.lock:
+            self.refresh()
+            self.jobs += 1
+            stats.reset()
+            if job == "create":
+                result = self.create(**args)
+            elif job == "validate":
+                result = self.validate(**args)
+            else:
+                raise JobError(f"Unknown job '{job}'")
+            manifest.definitions.save()
+            if args.get("profile"):
+                result["profile"] = stats.summary()
+            return result
+
+    def create(
+        self,
+        filename: str,
+        output: str,
+        jobs: int = 1,
+        incremental: bool = False,
+        stream: bool = False,
+        minimize: bool = False,
+        shard: list[str] = (),
+        parallel_shards: bool = False,
+        profile: bool = False,
+    ) -> dict:
+        try:
+            shards = [Shard.parse(spec) for spec in shard]
+        except ValueError as e:
+            raise JobError(f"Invalid --shard: {e}")
+
+        log = io.StringIO()
+        with redirect_stdout(log):
+            build(
+                filename,
+                output,
+                jobs,
+                incremental,
+                stream,
+                minimize,
+                shards,
+                parallel_shards,
+            )
+        return {"output": log.getvalue()}
+
+    def validate(
+        self, filename: str = None, lines: list[str] = None, profile: bool = False
+    ) -> dict:
+        if lines is None:
+            if filename is None:
+                raise JobError("Either filename or lines is required")
+            with open(filename, encoding="utf-8") as fh:
+                lines = fh.readlines()
+
+        # Imported here so the package doesn't import the validator ahead of
+        # python -m d2wishlist.cli.validator
+        from d2wishlist.cli.validator import DIMWishlist
+
+        with stats.phase("validate"):
+            parser = DIMWishlist(output=[], load_item=self.load_item)
+            try:
+                for line in lines:
+                    parser.process_line(line)
+            except Exception as e:
+                raise JobFailed(e, parser.output) from e
+        return {
+            "messages": parser.output,
+            "errors": stats.counters["validator.errors"],
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answers GET /status, and POST /create and /validate with a JSON object of
+    the job's arguments.
+
+    Jobs read and write files as the user running the server, so requests
+    are only answered if they name a loopback Host, which a page rebinding
+    its own hostname to this address can't do, and jobs are only accepted
+    as application/json, which a browser won't send to another origin
+    without a preflight request this never answers.
+    """
+
+    server_version = "d2wishlist"
+
+    def do_GET(self):
+        if not self.local_host():
+            return
+        if self.path != "/status":
+            self.reply(404, {"error": f"No such endpoint {self.path}"})
+            return
+        self.reply(200, self.server.jobs.status())
+
+    def do_POST(self):
+        if not self.local_host():
+            return
+        if self.headers.get_content_type() != "application/json":
+            self.reply(415, {"error": "Jobs must be sent as application/json"})
+            return
+
+        job = self.path.lstrip("/")
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            args = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(args, dict):
+                raise JobError("Arguments must be a JSON object")
+            result = self.server.jobs.run(job, args)
+        except (JobError, TypeError, ValueError, OSError) as e:
+            self.reply(400, {"error": str(e)})
+        except JobFailed as e:
+            self.reply(500, {"error": str(e), "messages": e.messages})
+            raise
+        except Exception as e:
+            self.reply(500, {"error": f"{type(e).__name__}: {e}"})
+            raise
+        else:
+            self.reply(200, result)
+
+    def local_host(self) -> bool:
+        """Checks the request's Host is a loopback address, replying if it isn't."""
+        host = self.headers.get("Host", "")
+        if host.startswith("["):
+            host = host[1:].partition("]")[0]
+        else:
+            host = host.rpartition(":")[0] or host
+        try:
+            loopback = host == "localhost" or ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            self.reply(403, {"error": f"Host '{host}' isn't a loopback address"})
+        return loopback
+
+    def reply(self, code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(
+    manifest_path: Annotated[
+        str,
+        typer.Option(
+            "--manifest",
+            help="Path to the Destiny 2 manifest SQLite database [default: manifest.sqlite3]",
+            envvar="D2WISHLIST_MANIFEST",
+        ),
+    ] = None,
+    additional_info: Annotated[
+        str,
+        typer.Option(
+            help="Path to d2-additional-info's generated season data [default: d2-additional-info/output]",
+            envvar="D2WISHLIST_ADDITIONAL_INFO",
+        ),
+    ] = None,
+    cache_size: Annotated[
+        int,
+        typer.Option(help="Number of decoded manifest definitions to keep in memory"),
+    ] = DEFAULT_MAXSIZE,
+    cache_dir: Annotated[
+        str,
+        typer.Option(
+            help="Directory to persist decoded manifest definitions in between runs",
+            envvar="D2WISHLIST_CACHE_DIR",
+        ),
+    ] = None,
+    host: Annotated[
+        str,
+        typer.Option(
+            help="Address to listen on; jobs read and write files as this user, so keep it local"
+        ),
+    ] = DEFAULT_HOST,
+    port: Annotated[int, typer.Option(help="Port to listen on")] = DEFAULT_PORT,
+):
+    print("Loading the manifest...")
+    jobs = Server(manifest_path, additional_info, cache_size, cache_dir)
+
+    httpd = HTTPServer((host, port), Handler)
+    httpd.jobs = jobs
+    print(f"Serving create and validate jobs on http://{host}:{httpd.server_port}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        manifest.definitions.save()
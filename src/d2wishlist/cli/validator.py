@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
+import argparse
 import fileinput
+import os
 import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 from rich.console import Console
 
+import d2wishlist.manifest as manifest
 from d2wishlist.manifest import InventoryItem, LookupError
+from d2wishlist.stats import stats
 
 console = Console()
 
@@ -15,64 +21,71 @@ class ValidationError(Exception):
 
 
 class DIMWishlist(object):
-    def __init__(self):
-        self.last_item = None
-        self.lineno = 0
+    def __init__(self, lineno=0, output=None, item_cache_size=256, load_item=None):
+        # Recently validated items, so lines for the same item don't reload it
+        # even when they're interleaved with other items. A long-running caller
+        # can pass its own cached loader to keep them between wishlists.
+        self.load_item = load_item or lru_cache(maxsize=item_cache_size)(InventoryItem)
+        self.lineno = lineno
+        # If output is a list, messages are collected there as (message, markup)
+        # pairs to be replayed later with replay(), instead of being printed
+        self.output = output
+
+    def print(self, message, markup=True):
+        if self.output is not None:
+            self.output.append((message, markup))
+        elif markup:
+            console.print(message)
+        else:
+            print(message)
 
     def validate(self, item, perks):
         roll = dict()
-        perk_items = dict()
 
+        # Known plugs only need a set lookup, anything else gets loaded so a
+        # missing perk is reported as such
+        plug_hashes = manifest.manifest.plug_hashes()
         for perkhash in perks:
+            if perkhash in plug_hashes:
+                continue
             try:
-                perk_items[perkhash] = InventoryItem(perkhash)
+                manifest.query_item(perkhash)
             except LookupError as e:
                 raise ValidationError(f"Perk {perkhash} doesn't exit in manifest: {e}")
 
-        perks_to_find = perks.copy()
-
-        for slot in range(0, len(item.sockets)):
-            socket = item.sockets[slot]
-            for perk in perks_to_find:
-                if perk in socket:
-                    roll[slot] = socket[perk]
-                    perks_to_find.remove(perk)
+        # Each perk takes the first socket it fits in that isn't already taken
+        perks_to_find = []
+        for perk in perks:
+            for slot in item.perk_sockets.get(perk, ()):
+                if slot not in roll:
+                    roll[slot] = item.sockets[slot][perk]
                     break
+            else:
+                perks_to_find.append(perk)
 
         if perks_to_find:
             raise ValidationError(
-                f"Unable to find socket for perks: {', '.join([str(perk_items[x]) for x in perks_to_find])}"
-            )
-
-        if len(perks) > len(roll):
-            r = set([str(x.hash) for x in roll.values()])
-            missing = [perk_items[x] for x in perks if x not in r]
-            raise ValidationError(
-                f"Perks not in manifest: {', '.join([str(x) for x in missing])}"
+                f"Unable to find socket for perks: {', '.join([perk_name(x) for x in perks_to_find])}"
             )
 
-        return roll
+        return dict(sorted(roll.items()))
 
     def process_item(self, line):
         # dimwishlist:item=3969379530&perks=839105230,1087426260,3619207468,3047969693
+        stats.count("validator.lines")
         itemdict = urllib.parse.parse_qs(line[12:])
         itemhash = itemdict["item"][0]
 
         try:
-            if self.last_item and self.last_item.hash == itemhash:
-                item = self.last_item
-            else:
-                item = InventoryItem(itemhash)
-                self.last_item = item
-
+            item = self.load_item(itemhash)
             self.validate(item, itemdict["perks"][0].split(","))
 
         except ValidationError as e:
-            console.print(f"{self.lineno} [blue]{item}[/blue] [red]Error![/red] {e}")
+            stats.count("validator.errors")
+            self.print(f"{self.lineno} [blue]{item}[/blue] [red]Error![/red] {e}")
         except LookupError as e:
-            console.print(
-                f"{self.lineno} [blue]{itemhash}[/blue] [red]Error![/red] {e}"
-            )
+            stats.count("validator.errors")
+            self.print(f"{self.lineno} [blue]{itemhash}[/blue] [red]Error![/red] {e}")
 
     def process_line(self, rawline):
         line = rawline.strip()
@@ -84,10 +97,10 @@ class DIMWishlist(object):
             return
 
         if line.startswith("title:"):
-            console.print(f"[bold blue]{line[6:]}[/bold blue]")
+            self.print(f"[bold blue]{line[6:]}[/bold blue]")
             return
         if line.startswith("description:"):
-            console.print(f"[blue]{line[12:]}[/blue]")
+            self.print(f"[blue]{line[12:]}[/blue]")
             return
 
         if line.startswith("dimwishlist:"):
@@ -96,15 +109,146 @@ class DIMWishlist(object):
             try:
                 self.process_item(line)
             except:
-                console.print(f"[red]Error[/red] while processing line {self.lineno}")
-                console.print(line)
+                self.print(f"[red]Error[/red] while processing line {self.lineno}")
+                self.print(line)
                 raise
             return
 
-        print(f"Unhandled line: {line}")
+        self.print(f"Unhandled line: {line}", markup=False)
+
+
+def perk_name(perkhash):
+    """Returns a perk's name and hash for error messages, loading its definition."""
+    return str(manifest.manifest.plug(perkhash))
+
+
+def replay(output):
+    for message, markup in output:
+        if markup:
+            console.print(message)
+        else:
+            print(message)
+
+
+def item_hash(line):
+    """Returns the item hash of a dimwishlist: line, or None for any other line."""
+    line = line.strip()
+    if not line.startswith("dimwishlist:"):
+        return None
+    return urllib.parse.parse_qs(line[12:].split("#", 1)[0]).get("item", [None])[0]
+
+
+def chunk_lines(lines, chunk_size):
+    """
+    Splits lines into (first line number, lines) chunks of about chunk_size
+    lines, only ever breaking between two different items.
+    """
+    chunk = []
+    start = 1
+    last_item = None
+    for lineno, line in enumerate(lines, 1):
+        item = item_hash(line)
+        if item is not None:
+            if len(chunk) >= chunk_size and item != last_item:
+                yield start, chunk
+                chunk = []
+                start = lineno
+            last_item = item
+        chunk.append(line)
+    if chunk:
+        yield start, chunk
+
+
+def validate_chunk(chunk):
+    """
+    Validates a chunk of lines, returning its messages and the unexpected
+    exception that stopped it, if any, so the messages leading up to it
+    aren't lost with the worker's output.
+    """
+    start, lines = chunk
+    parser = DIMWishlist(lineno=start - 1, output=[])
+    try:
+        for line in lines:
+            parser.process_line(line)
+    except Exception as e:
+        return parser.output, e
+    return parser.output, None
+
+
+def _init_worker(manifest_path):
+    # Forked workers keep the warm handle, opening their own connection on
+    # first use; only one started from scratch (spawn) needs pointing at it
+    if manifest.manifest.path != manifest_path:
+        manifest.configure(manifest_path)
+
+
+def validate_parallel(lines, jobs, chunk_size):
+    """
+    Validates lines across jobs worker processes, printing the results in
+    the original line order.
+
+    Every item in the wishlist and the set of plug hashes are loaded first, so
+    (forked) workers all start out with a warm cache.
+    """
+    manifest.prefetch_items(
+        {int(h) for h in map(item_hash, lines) if h is not None and h.isdigit()}
+    )
+    manifest.manifest.plug_hashes()
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(manifest.manifest.path,),
+    ) as pool:
+        for output, error in pool.map(validate_chunk, chunk_lines(lines, chunk_size)):
+            replay(output)
+            if error is not None:
+                raise error
 
 
 if __name__ == "__main__":
-    parser = DIMWishlist()
-    for line in fileinput.input(encoding="utf-8"):
-        parser.process_line(line)
+    argparser = argparse.ArgumentParser(description="Validate DIM-format wishlists")
+    argparser.add_argument("files", nargs="*", help="Wishlist files (default: stdin)")
+    argparser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to validate with",
+    )
+    argparser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="Approximate number of lines per work unit when using --jobs",
+    )
+    argparser.add_argument(
+        "--manifest", help="Path to the Destiny 2 manifest SQLite database"
+    )
+    argparser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print time spent validating, manifest queries and cache hit rates",
+    )
+    argparser.add_argument(
+        "--stats-json", help="Write the --profile statistics to this file as JSON"
+    )
+    args = argparser.parse_args()
+
+    manifest.configure(args.manifest)
+    manifest.configure_cache(cache_dir=os.environ.get("D2WISHLIST_CACHE_DIR"))
+    lines = fileinput.input(args.files, encoding="utf-8")
+    with stats.phase("validate"):
+        if args.jobs > 1:
+            validate_parallel(list(lines), args.jobs, args.chunk_size)
+        else:
+            parser = DIMWishlist()
+            for line in lines:
+                parser.process_line(line)
+            info = parser.load_item.cache_info()
+            stats.add_section(
+                "item cache",
+                {"hits": info.hits, "misses": info.misses, "size": info.currsize},
+            )
+    manifest.definitions.save()
+    stats.add_section("definition cache", manifest.definitions.stats())
+    stats.emit(args.profile, args.stats_json)
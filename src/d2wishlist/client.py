@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Forwards create and validate jobs to a running `d2wishlist_creator serve`.
+
+This only imports the standard library (and rich, to show validation errors),
+so each call costs a fraction of a full run:
+
+    python -m d2wishlist.client validate examples/wishlist.txt
+"""
+
+import argparse
+import json
+import os
+import sys
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7870
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}/"
+
+
+class ClientError(Exception):
+    def __init__(self, message: str, messages: list = ()):
+        super().__init__(message)
+        # Validation messages from before a job failed
+        self.messages = messages
+
+
+def submit(job: str, args: dict = None, url: str = DEFAULT_URL) -> dict:
+    """
+    Runs job with args on the server at url, returning its result. Without
+    args, job is fetched instead, as for "status".
+    """
+    request = Request(
+        f"{url.rstrip('/')}/{job}",
+        data=None if args is None else json.dumps(args).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urlopen(request) as response:
+            return json.load(response)
+    except HTTPError as e:
+        try:
+            body = json.load(e)
+            message = body["error"]
+        except (ValueError, KeyError):
+            raise ClientError(e.reason)
+        raise ClientError(message, body.get("messages", ()))
+    except URLError as e:
+        raise ClientError(f"Couldn't reach d2wishlist server at {url}: {e.reason}")
+
+
+def print_messages(messages):
+    """Prints validation messages the way the validator would."""
+    if not messages:
+        return
+    from rich.console import Console
+
+    console = Console()
+    for message, markup in messages:
+        if markup:
+            console.print(message)
+        else:
+            print(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--url",
+        default=os.environ.get("D2WISHLIST_SERVER", DEFAULT_URL),
+        help=f"Server to send the job to (default: $D2WISHLIST_SERVER or {DEFAULT_URL})",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the server's time spent per phase for this job",
+    )
+    jobs = parser.add_subparsers(dest="job", required=True)
+
+    create = jobs.add_parser("create", help="Create a DIM wishlist from YAML")
+    create.add_argument("filename", help="Filename of YAML-formatted wishlist")
+    create.add_argument("--output", required=True, help="Filename for the output")
+    create.add_argument("--jobs", type=int, default=1)
+    create.add_argument("--incremental", action="store_true")
+    create.add_argument("--stream", action="store_true")
+    create.add_argument("--minimize", action="store_true")
+    create.add_argument("--shard", action="append", default=[])
+    create.add_argument("--parallel-shards", action="store_true")
+
+    validate = jobs.add_parser("validate", help="Validate a DIM wishlist")
+    validate.add_argument("file", help="Wishlist file, or - to send stdin")
+
+    jobs.add_parser("status", help="Show what the server has loaded")
+
+    args = parser.parse_args()
+
+    try:
+        if args.job == "create":
+            result = submit(
+                "create",
+                {
+                    "filename": os.path.abspath(args.filename),
+                    "output": os.path.abspath(args.output),
+                    "jobs": args.jobs,
+                    "incremental": args.incremental,
+                    "stream": args.stream,
+                    "minimize": args.minimize,
+                    "shard": [_absolute_shard(s) for s in args.shard],
+                    "parallel_shards": args.parallel_shards,
+                    "profile": args.profile,
+                },
+                args.url,
+            )
+            print(result["output"], end="")
+        elif args.job == "validate":
+            if args.file == "-":
+                job = {"lines": sys.stdin.readlines()}
+            else:
+                job = {"filename": os.path.abspath(args.file)}
+            job["profile"] = args.profile
+            result = submit("validate", job, args.url)
+            print_messages(result["messages"])
+        else:
+            result = submit("status", url=args.url)
+            print(json.dumps(result, indent=2))
+    except ClientError as e:
+        print_messages(e.messages)
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if "profile" in result:
+        print()
+        print(result["profile"])
+
+
+def _absolute_shard(spec: str) -> str:
+    path, sep, filters = spec.rpartition(":")
+    if not sep or not path:
+        # Left for the server to report
+        return spec
+    return f"{os.path.abspath(path)}{sep}{filters}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+from typing import NamedTuple
+
+from d2wishlist.manifest import (
+    INVITEMDEF,
+    PLUGSETDEF,
+    PREFETCH_CHUNK_SIZE,
+    SOCKET_OVERRIDES,
+    Manifest,
+    NameIndex,
+    sql_id,
+)
+from d2wishlist.sidecar import DUMMY_CATEGORY, perk_socket_layout
+
+# Names of the non-dummy items in the given buckets, extracted by SQLite so
+# neither the items nor an index sidecar need decoding or building
+VARIANT_CANDIDATES = f"""
+SELECT
+  json_extract(json, "$.inventory.bucketTypeHash"),
+  json_extract(json, "$.displayProperties.name"),
+  id,
+  json_extract(json, "$.hash")
+FROM
+  {INVITEMDEF}
+WHERE
+  json_extract(json, "$.inventory.bucketTypeHash") IN ({{}})
+  AND json_extract(json, "$.displayProperties.name") IS NOT NULL
+  AND NOT EXISTS (
+    SELECT *
+    FROM
+      json_each(json, "$.itemCategoryHashes")
+    WHERE
+      json_each.value = {DUMMY_CATEGORY}
+  )
+"""
+
+
+class ItemChange(NamedTuple):
+    """How a patch changed one wishlist Item, and which of its Rolls it affects."""
+
+    item: object
+    missing: bool
+    perks_removed: dict[int, str]
+    perks_added: dict[int, str]
+    variants_removed: dict[int, str]
+    variants_added: dict[int, str]
+    rolls: list
+
+
+class Side(object):
+    """One of the two manifests being compared, fetching raw rows in batches."""
+
+    def __init__(self, handle: Manifest):
+        self.handle = handle
+        self.rows = dict()
+        self.names = dict()
+        self.name_index = None
+
+    def fetch(self, table: str, hashes):
+        """Loads the raw JSON for hashes, skipping ones already fetched."""
+        ids = sorted({sql_id(h) for h in hashes if (table, h) not in self.rows})
+        c = self.handle.cursor()
+        for i in range(0, len(ids), PREFETCH_CHUNK_SIZE):
+            chunk = ids[i : i + PREFETCH_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            r = c.execute(
+                f"SELECT id, json FROM {table} WHERE id IN ({placeholders})", chunk
+            )
+            for id, raw in r:
+                self.rows[(table, id & 0xFFFFFFFF)] = raw
+        for h in hashes:
+            self.rows.setdefault((table, h), None)
+
+    def digest(self, table: str, hash: int) -> bytes | None:
+        raw = self.rows[(table, hash)]
+        if raw is None:
+            return None
+        if isinstance(raw, str):
+            raw = raw.encode()
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def definition(self, table: str, hash: int) -> dict | None:
+        raw = self.rows[(table, hash)]
+        return None if raw is None else json.loads(raw)
+
+    def index_names(self, buckets):
+        """Indexes the names of every non-dummy item in buckets, for variants()."""
+        buckets = sorted(buckets)
+        r = self.handle.cursor().execute(
+            VARIANT_CANDIDATES.format(",".join("?" * len(buckets))), buckets
+        )
+        rows = []
+        for bucket, name, id, hash in r:
+            self.names[hash] = name
+            rows.append((bucket, name.casefold(), id, hash))
+        self.name_index = NameIndex(rows)
+
+    def variants(self, definition: dict) -> dict[int, str]:
+        """Returns the other non-dummy items in the bucket named like definition."""
+        name = definition["displayProperties"]["name"]
+        matches = self.name_index.starting_with(
+            definition["inventory"]["bucketTypeHash"], name.casefold()
+        )
+        return {
+            hash: self.names[hash] for _, hash in matches if hash != definition["hash"]
+        }
+
+
+def socket_plugs(hash: int, definition: dict) -> list[tuple[list[int], int | None]]:
+    """
+    Returns the plugs listed directly on each of definition's perk sockets,
+    along with the plug set each socket draws the rest from, if any.
+    """
+    if hash in SOCKET_OVERRIDES:
+        return [(list(perks), None) for perks in SOCKET_OVERRIDES[hash].values()]
+    if "sockets" not in definition:
+        return []
+    return list(perk_socket_layout(definition["sockets"]))
+
+
+def _columns(side: Side, plugs) -> list[set[int]]:
+    columns = []
+    for direct, plugset in plugs:
+        column = set(direct)
+        if plugset is not None:
+            definition = side.definition(PLUGSETDEF, plugset)
+            if definition:
+                column.update(
+                    p["plugItemHash"] for p in definition["reusablePlugItems"]
+                )
+        columns.append(column)
+    return columns
+
+
+def _common_perks(side: Side, hashes) -> dict[int, str]:
+    """Names the tierType 2 (Common) perks of hashes, the ones wishlists can list."""
+    side.fetch(INVITEMDEF, hashes)
+    perks = dict()
+    for h in hashes:
+        definition = side.definition(INVITEMDEF, h)
+        if definition and definition["inventory"]["tierType"] == 2:
+            perks[h] = definition["displayProperties"]["name"]
+    return perks
+
+
+def diff(old: Manifest, new: Manifest, items: list) -> list[ItemChange]:
+    """
+    Finds the wishlist items whose perks or variants differ between the old
+    and new manifests.
+
+    Definitions are compared by a digest of their raw JSON. Only the wishlist's
+    own items are decoded, to find their plug sets, and only the perks that
+    differ between the two sides are decoded to be named. Items and plug sets
+    whose digests match are skipped entirely.
+
+    Variants are the same-named items a build would consider; whether a new
+    one also comes from the same season is left for the rebuild to decide.
+    They're found from the names SQLite extracts for the wishlist items'
+    buckets, so neither manifest's index sidecar is built.
+    """
+    sides = (Side(old), Side(new))
+    hashes = {h for item in items for h in item.hashes()}
+    for side in sides:
+        side.fetch(INVITEMDEF, hashes)
+
+    buckets = {
+        definition["inventory"]["bucketTypeHash"]
+        for side in sides
+        for h in hashes
+        if (definition := side.definition(INVITEMDEF, h))
+    }
+    for side in sides:
+        side.index_names(buckets)
+
+    plugs = dict()
+    for h in hashes:
+        for side in sides:
+            definition = side.definition(INVITEMDEF, h)
+            plugs[(side, h)] = socket_plugs(h, definition) if definition else []
+
+    plugsets = {
+        plugset for sockets in plugs.values() for _, plugset in sockets if plugset
+    }
+    for side in sides:
+        side.fetch(PLUGSETDEF, plugsets)
+
+    changes = []
+    for item in items:
+        primary = item.hashes()[0]
+        old_definition = sides[0].definition(INVITEMDEF, primary)
+        new_definition = sides[1].definition(INVITEMDEF, primary)
+        if new_definition is None:
+            changes.append(ItemChange(item, True, {}, {}, {}, {}, list(item.rolls)))
+            continue
+
+        removed = dict()
+        added = dict()
+        for h in item.hashes():
+            unchanged = sides[0].digest(INVITEMDEF, h) == sides[1].digest(
+                INVITEMDEF, h
+            ) and all(
+                sides[0].digest(PLUGSETDEF, plugset)
+                == sides[1].digest(PLUGSETDEF, plugset)
+                for _, plugset in plugs[(sides[1], h)]
+                if plugset
+            )
+            if unchanged:
+                continue
+
+            old_columns = _columns(sides[0], plugs[(sides[0], h)])
+            new_columns = _columns(sides[1], plugs[(sides[1], h)])
+            width = max(len(old_columns), len(new_columns))
+            old_columns += [set()] * (width - len(old_columns))
+            new_columns += [set()] * (width - len(new_columns))
+            for before, after in zip(old_columns, new_columns):
+                removed.update(_common_perks(sides[0], before - after))
+                added.update(_common_perks(sides[1], after - before))
+
+        old_variants = sides[0].variants(old_definition) if old_definition else {}
+        new_variants = sides[1].variants(new_definition)
+        variants_removed = {
+            h: n for h, n in old_variants.items() if h not in new_variants
+        }
+        variants_added = {
+            h: n for h, n in new_variants.items() if h not in old_variants
+        }
+
+        if not (removed or added or variants_removed or variants_added):
+            continue
+
+        if variants_removed or variants_added:
+            rolls = list(item.rolls)
+        else:
+            names = {n.casefold() for n in (removed | added).values()}
+            rolls = [
+                roll
+                for roll in item.rolls
+                if any(p.casefold() in names for column in roll.perks for p in column)
+            ]
+        changes.append(
+            ItemChange(
+                item, False, removed, added, variants_removed, variants_added, rolls
+            )
+        )
+
+    return changes
@@ -1,24 +1,118 @@
 #!/usr/bin/env python3
 
+import hashlib
 import json
+import os
+import threading
 
+import d2wishlist.manifest as manifest
+from d2wishlist.stats import stats
 
-def get_season(item: object) -> int:
-    if "iconWatermark" in item.definition and item.iconWatermark in D2SeasonFromOverlay:
-        return D2SeasonFromOverlay[item.iconWatermark]
-    if (
-        "collectibleHash" in item.definition
-        and item.collectible().sourceHash in D2SeasonFromSource
-    ):
-        return D2SeasonFromSource[item.collectible().sourceHash]
-    if item.hash and item.hash in D2Season:
-        return D2Season[item.hash]
-    return None
-
-
-with open("d2-additional-info/output/watermark-to-season.json") as fh:
-    D2SeasonFromOverlay = json.load(fh)
-with open("d2-additional-info/output/source-to-season-v2.json") as fh:
-    D2SeasonFromSource = json.load(fh)
-with open("d2-additional-info/output/seasons.json") as fh:
-    D2Season = json.load(fh)
+# Where d2-additional-info keeps its generated data
+DATA_PATH = os.path.join("d2-additional-info", "output")
+
+WATERMARK_FILE = "watermark-to-season.json"
+SOURCE_FILE = "source-to-season-v2.json"
+ITEM_FILE = "seasons.json"
+
+
+class SeasonResolver(object):
+    """
+    Works out which season items come from, using the d2-additional-info data.
+
+    The data is read the first time it's needed, from path (or
+    $D2WISHLIST_ADDITIONAL_INFO, or d2-additional-info/output). Seasons are
+    remembered per item and manifest version, and resolving a batch of items
+    looks up all of their collectibles' sources with one query.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("D2WISHLIST_ADDITIONAL_INFO", DATA_PATH)
+        self.by_watermark = None
+        self.by_source = None
+        self.by_item = None
+        self._seasons = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"SeasonResolver({self.path!r})"
+
+    def _read(self, filename: str) -> dict:
+        with open(os.path.join(self.path, filename)) as fh:
+            return json.load(fh)
+
+    def load(self):
+        with self._lock:
+            if self.by_watermark is not None:
+                return
+            by_watermark = self._read(WATERMARK_FILE)
+            self.by_source = {int(k): v for k, v in self._read(SOURCE_FILE).items()}
+            self.by_item = {int(k): v for k, v in self._read(ITEM_FILE).items()}
+            self.by_watermark = by_watermark
+
+    def data_version(self) -> str:
+        """Returns a digest of the season data, for keying caches built from it."""
+        self.load()
+        data = json.dumps(
+            [self.by_watermark, self.by_source, self.by_item], sort_keys=True
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def season(self, item) -> int | None:
+        return self.seasons([item])[int(item.hash)]
+
+    @stats.timed("season.lookup")
+    def seasons(self, items) -> dict[int, int | None]:
+        """Returns the season of each of items, keyed by item hash."""
+        self.load()
+        memo = self._seasons.setdefault(manifest.manifest.version(), dict())
+
+        found = dict()
+        pending = dict()
+        for item in items:
+            hash = int(item.hash)
+            if hash in memo:
+                found[hash] = memo[hash]
+                continue
+
+            if item.iconWatermark in self.by_watermark:
+                found[hash] = memo[hash] = self.by_watermark[item.iconWatermark]
+            elif item.collectibleHash is not None:
+                pending[hash] = item.collectibleHash
+            else:
+                found[hash] = memo[hash] = self.by_item.get(hash)
+
+        if pending:
+            sources = manifest.collectible_sources(pending.values())
+            for hash, collectible in pending.items():
+                season = self.by_source.get(sources.get(collectible))
+                if season is None:
+                    season = self.by_item.get(hash)
+                found[hash] = memo[hash] = season
+
+        return found
+
+
+resolver = SeasonResolver()
+
+
+def configure(path: str = None):
+    """
+    Points the module-level season resolver at the d2-additional-info data in
+    path. Passing None falls back to $D2WISHLIST_ADDITIONAL_INFO or
+    d2-additional-info/output.
+    """
+    global resolver
+    resolver = SeasonResolver(path)
+
+
+def get_season(item: object) -> int | None:
+    return resolver.season(item)
+
+
+def get_seasons(items) -> dict[int, int | None]:
+    return resolver.seasons(items)
+
+
+def data_version() -> str:
+    return resolver.data_version()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import struct
+import tempfile
+import zlib
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+BUNGIE_URL = "https://www.bungie.net"
+MANIFEST_ENDPOINT = "/Platform/Destiny2/Manifest/"
+
+# This doesn't matter for fetching the Manifest, but Bungie's API requires something be sent
+API_KEY = "vootvoot"
+
+CHUNK_SIZE = 1024 * 1024
+
+# Seconds to wait for a connection or the next chunk of a response before giving up
+TIMEOUT = 60
+
+# Zip local file header, up to the file name
+ZIP_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+ZIP_LOCAL_SIGNATURE = 0x04034B50
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_DATA_DESCRIPTOR = 0x08
+
+
+class FetchError(Exception):
+    pass
+
+
+def manifest_info(
+    base_url: str = BUNGIE_URL, api_key: str = API_KEY, timeout: float = TIMEOUT
+) -> dict:
+    """Asks the Bungie API for the current manifest, returning its Response."""
+    request = Request(
+        urljoin(base_url, MANIFEST_ENDPOINT), headers={"X-API-Key": api_key}
+    )
+    with urlopen(request, timeout=timeout) as response:
+        data = json.load(response)
+
+    if "Response" not in data:
+        raise FetchError(f"Unexpected manifest response: {data.get('Message', data)}")
+    return data["Response"]
+
+
+def stored_version(path: str) -> str | None:
+    """Returns the version saved alongside the manifest at path, if there is one."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(f"{path}.version") as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _read_exactly(stream, size: int) -> bytes:
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise FetchError("Manifest archive ended early")
+        data += more
+    return data
+
+
+def extract_first(stream, fh) -> int:
+    """
+    Extracts the first file of the zip archive being read from stream into fh,
+    returning its size.
+
+    Only the local file header at the start of the archive is needed, so the
+    archive never has to be kept around or seeked through: the data is
+    decompressed and checked as it arrives.
+    """
+    (
+        signature,
+        _version,
+        flags,
+        method,
+        _time,
+        _date,
+        crc,
+        compressed_size,
+        _size,
+        name_length,
+        extra_length,
+    ) = ZIP_LOCAL_HEADER.unpack(_read_exactly(stream, ZIP_LOCAL_HEADER.size))
+    if signature != ZIP_LOCAL_SIGNATURE:
+        raise FetchError("Manifest archive isn't a zip file")
+    _read_exactly(stream, name_length + extra_length)
+
+    if method == ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    elif method == ZIP_STORED and not flags & ZIP_DATA_DESCRIPTOR:
+        decompressor = None
+    else:
+        raise FetchError(f"Unsupported zip compression method {method}")
+
+    checksum = 0
+    written = 0
+    remaining = compressed_size
+    while True:
+        if decompressor is None:
+            if not remaining:
+                break
+            chunk = stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise FetchError("Manifest archive ended early")
+            remaining -= len(chunk)
+            data = chunk
+        else:
+            if decompressor.eof:
+                break
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                raise FetchError("Manifest archive ended early")
+            data = decompressor.decompress(chunk)
+
+        fh.write(data)
+        checksum = zlib.crc32(data, checksum)
+        written += len(data)
+
+    if flags & ZIP_DATA_DESCRIPTOR:
+        # The real checksum follows the data, optionally after a signature
+        descriptor = decompressor.unused_data + stream.read(16)
+        if descriptor[:4] == b"PK\x07\x08":
+            descriptor = descriptor[4:]
+        crc = struct.unpack("<I", descriptor[:4])[0]
+
+    if checksum != crc:
+        raise FetchError("Manifest archive is corrupt (CRC mismatch)")
+    return written
+
+
+def download(url: str, path: str, version: str, timeout: float = TIMEOUT):
+    """
+    Downloads the zipped manifest at url and swaps it into place at path,
+    recording version in path.version.
+
+    The database is extracted to a temporary file of its own next to path
+    first, so downloads running at the same time don't write into each
+    other's. The old version file is removed before the swap so a crash in
+    between can't leave a new manifest labelled with the old version. A
+    connection that stalls for longer than timeout seconds is given up on.
+    """
+    tmp_path = _temp_path(path)
+    try:
+        with urlopen(url, timeout=timeout) as response, open(tmp_path, "wb") as fh:
+            extract_first(response, fh)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    version_path = f"{path}.version"
+    if os.path.exists(version_path):
+        os.remove(version_path)
+    os.replace(tmp_path, path)
+
+    tmp_path = _temp_path(version_path)
+    with open(tmp_path, "w") as fh:
+        fh.write(f"{version}\n")
+    os.replace(tmp_path, version_path)
+
+
+def _temp_path(path: str) -> str:
+    """Creates an empty, readable temporary file next to path, returning its path."""
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(path)),
+    )
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)
+    return tmp_path
+
+
+def fetch(
+    path: str,
+    base_url: str = BUNGIE_URL,
+    language: str = "en",
+    api_key: str = API_KEY,
+    force: bool = False,
+    timeout: float = TIMEOUT,
+) -> tuple[str, bool]:
+    """
+    Brings the manifest at path up to date with the one the API advertises.
+
+    Returns the current version and whether a new manifest was downloaded.
+    """
+    info = manifest_info(base_url, api_key, timeout)
+    version = info["version"]
+    if not force and stored_version(path) == version:
+        return version, False
+
+    try:
+        content_path = info["mobileWorldContentPaths"][language]
+    except KeyError:
+        raise FetchError(f"No manifest available for language '{language}'")
+
+    download(urljoin(base_url, content_path), path, version, timeout)
+    return version, True
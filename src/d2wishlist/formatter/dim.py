@@ -1,4 +1,10 @@
 import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import NamedTuple
+
+from d2wishlist.stats import stats
 
 TAG_MAP = {
     "pvp": "PvP",
@@ -12,29 +18,232 @@ TAG_MAP = {
 }
 TAG_ORDER = tuple(TAG_MAP.keys())
 
+# Number of inventory items whose written perk combos are remembered when
+# writing a stream, where there's no telling which items come up again
+STREAM_DEDUP_ITEMS = 1024
+
 
 def tag_sort(x):
     return TAG_ORDER.index(x)
 
 
+class Block(NamedTuple):
+    """One note block of output: its comment lines, then a perk line per combo."""
+
+    header: str
+    item_hash: str
+    combos: list[tuple[int, ...]]
+
+
+class Shard(NamedTuple):
+    """
+    An extra output holding part of the wishlist: the items from any of
+    seasons, and of those only the rolls with any of tags. Empty means any.
+    """
+
+    path: str
+    seasons: frozenset[int] = frozenset()
+    tags: frozenset[str] = frozenset()
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """
+        Parses a PATH:FILTERS spec, where FILTERS is a comma-separated list of
+        season=N and tag=T terms, such as "pve-s25.txt:season=25,tag=pve".
+        """
+        path, sep, filters = spec.rpartition(":")
+        if not sep or not path:
+            raise ValueError(f"Shard '{spec}' should look like PATH:FILTERS")
+
+        seasons = set()
+        tags = set()
+        for term in filters.split(","):
+            key, _, value = term.partition("=")
+            if key == "season" and value.isdigit():
+                seasons.add(int(value))
+            elif key == "tag" and value:
+                tags.add(value)
+            else:
+                raise ValueError(f"Unknown shard filter '{term}' in '{spec}'")
+        return cls(path, frozenset(seasons), frozenset(tags))
+
+    def matches_item(self, item) -> bool:
+        return not self.seasons or item._season in self.seasons
+
+    def matches_roll(self, roll) -> bool:
+        return not self.tags or not self.tags.isdisjoint(roll.tags)
+
+
+def roll_columns(roll) -> list[frozenset[int]]:
+    return [frozenset(int(p.hash) for p in perks) for perks in roll._perk_items]
+
+
+def covers(columns, other) -> bool:
+    """Checks whether every perk combo of the other roll is also one of columns'."""
+    return len(columns) == len(other) and all(o <= c for c, o in zip(columns, other))
+
+
 class DIMFormatter(object):
-    def __init__(self, wishlist, output_file):
+    def __init__(
+        self, wishlist, output_file, build_cache=None, minimize=False, shard=None
+    ):
         self.wishlist = wishlist
         self.output_file = output_file
-        self.written_perks = set()
+        self.build_cache = build_cache
+        # Leave out note blocks that every perk line was deduplicated from
+        self.minimize = minimize
+        # Only write the items and rolls this Shard matches. The build cache
+        # holds whole items, so it can't be used along with a shard.
+        self.shard = shard
+        self.lines_removed = 0
+        # Perk combos already written, per inventory item hash, least
+        # recently written first
+        self.written_perks = OrderedDict()
+
+    def write(self, items=None):
+        """
+        Writes out the wishlist.
+
+        If items is given (for instance a stream of items being resolved as
+        they're read), those are written instead of the wishlist's own items,
+        and only the perk combos of the last STREAM_DEDUP_ITEMS inventory items
+        written are remembered, so a combo repeated for an item that comes up
+        again further apart than that is written again. Otherwise the set of
+        perk combos written for an inventory item is dropped as soon as no
+        later item can write to it again.
+        """
+        last_use = None
+        if items is None:
+            items = self.wishlist.wishlist
+            last_use = self.last_use(items)
 
-    def write(self):
         with open(self.output_file, "w") as fh:
-            fh.write(f"title:{self.wishlist.title}\n")
-            fh.write(f"description:{self.wishlist.description}\n\n")
+            self.write_header(fh)
+            for i, item in enumerate(items):
+                self.write_item(fh, item, i, last_use)
+
+    def last_use(self, items) -> dict:
+        """Maps each inventory item hash to the index of the last item writing to it."""
+        return {
+            h: i
+            for i, item in enumerate(items)
+            if self.wants(item)
+            for h in self._item_hashes(item)
+        }
 
-            for item in self.wishlist.wishlist:
-                for roll in item.rolls:
-                    self._write_roll(fh, item, roll, item._inventory_item)
-                    for variant in item._variants:
-                        self._write_roll(fh, item, roll, variant)
+    def wants(self, item) -> bool:
+        return self.shard is None or self.shard.matches_item(item)
 
-    def _write_roll(self, fh, item, roll, inv_item):
+    def write_header(self, fh):
+        fh.write(f"title:{self.wishlist.title}\n")
+        fh.write(f"description:{self.wishlist.description}\n\n")
+
+    def write_item(self, fh, item, index=None, last_use=None):
+        if not self.wants(item):
+            return
+
+        blocks = self._item_blocks(item)
+        self._write_blocks(fh, blocks)
+        if last_use is not None:
+            for block in blocks:
+                if last_use[block.item_hash] == index:
+                    self.written_perks.pop(block.item_hash, None)
+        else:
+            for block in blocks:
+                self.written_perks.move_to_end(block.item_hash)
+            while len(self.written_perks) > STREAM_DEDUP_ITEMS:
+                self.written_perks.popitem(last=False)
+                stats.count("lines.dedup_evicted")
+
+    def _item_hashes(self, item):
+        if self.build_cache is not None:
+            blocks = self.build_cache.peek(item)
+            if blocks is not None:
+                return {block.item_hash for block in blocks}
+        return {item._inventory_item.hash} | {v.hash for v in item._variants}
+
+    def _item_blocks(self, item):
+        if self.build_cache is None:
+            return self.render_item(item)
+
+        blocks = self.build_cache.get(item)
+        if blocks is None:
+            blocks = self.render_item(item)
+            self.build_cache.put(item, blocks)
+        return blocks
+
+    def _write_blocks(self, fh, blocks):
+        written = skipped = removed = 0
+        for block in blocks:
+            seen = self.written_perks.setdefault(block.item_hash, set())
+            prefix = f"dimwishlist:item={block.item_hash}&perks="
+            lines = []
+            for combo in block.combos:
+                if combo in seen:
+                    skipped += 1
+                    continue
+                seen.add(combo)
+                lines.append(f"{prefix}{','.join(map(str, combo))}\n")
+
+            header_lines = block.header.count("\n") + 1
+            if self.minimize and not lines:
+                removed += header_lines
+                continue
+
+            fh.write(block.header)
+            fh.writelines(lines)
+            fh.write("\n")
+            written += header_lines + len(lines)
+        self.lines_removed += removed
+        stats.count("lines.written", written)
+        stats.count("lines.duplicates_skipped", skipped)
+        if removed:
+            stats.count("lines.minimized", removed)
+
+    def render_item(self, item):
+        """
+        Renders the output blocks for all of an item's rolls (or those in the
+        shard) and variants.
+
+        Each roll's perk combos are expanded once and shared by the blocks for
+        every variant. Repeated combos are left in, they're dropped as the
+        blocks are written.
+
+        When minimizing, rolls whose perk columns are each covered by those of
+        an earlier roll on the item are folded into it: all of their combos
+        would be deduplicated anyway, so they're never expanded and their
+        blocks are left empty for _write_blocks() to drop.
+        """
+        rolls = item.rolls
+        if self.shard is not None:
+            rolls = [roll for roll in rolls if self.shard.matches_roll(roll)]
+
+        blocks = []
+        kept = []
+        for roll in rolls:
+            folded = False
+            if self.minimize:
+                columns = roll_columns(roll)
+                folded = any(covers(k, columns) for k in kept)
+                if folded:
+                    stats.count("rolls.folded")
+                else:
+                    kept.append(columns)
+
+            combos = []
+            if not folded:
+                combos = list(
+                    itertools.product(
+                        *([int(p.hash) for p in perks] for perks in roll._perk_items)
+                    )
+                )
+            notes = self._roll_notes(roll)
+            for inv_item in [item._inventory_item] + item._variants:
+                header = f"// {inv_item.name} (Season {item._season})\n{notes}"
+                blocks.append(Block(header, inv_item.hash, combos))
+        return blocks
+
+    def _roll_notes(self, roll):
         tags = sorted(roll.tags, key=tag_sort)
         tag_string = " / ".join([TAG_MAP.get(t, f"??? {t} ???") for t in tags])
 
@@ -49,16 +258,36 @@ class DIMFormatter(object):
         if roll.masterwork:
             masterwork = f" Recommended MW: {', '.join(roll.masterwork)}."
 
-        fh.write(f"// {inv_item.name} (Season {item.season})\n")
-        fh.write(
-            f'//notes:{self.wishlist.author}{note_tags}: "{roll.text}"{masterwork}{dim_tags}\n'
-        )
+        return f'//notes:{self.wishlist.author}{note_tags}: "{roll.text}"{masterwork}{dim_tags}\n'
+
+
+def write_all(formatters, items=None, threads=False):
+    """
+    Writes out several formatters (say the full wishlist and its shards) in a
+    single pass over items, rendering and writing each item to every output
+    in turn.
+
+    With threads, each formatter instead writes out the wishlist's items in
+    its own thread. That needs the items up front, so isn't done for streams.
+    """
+    if items is None and threads:
+        with ThreadPoolExecutor(max_workers=len(formatters)) as pool:
+            for _ in pool.map(lambda dim: dim.write(), formatters):
+                pass
+        return
+
+    last_uses = [None] * len(formatters)
+    if items is None:
+        items = formatters[0].wishlist.wishlist
+        last_uses = [dim.last_use(items) for dim in formatters]
 
-        for perk_combo in itertools.product(*roll._perk_items):
-            perk_string = ",".join([p.hash for p in perk_combo])
-            roll_string = f"item={inv_item.hash}&perks={perk_string}"
-            if roll_string not in self.written_perks:
-                self.written_perks.add(roll_string)
-                fh.write(f"dimwishlist:{roll_string}\n")
+    with ExitStack() as stack:
+        outputs = []
+        for dim, last_use in zip(formatters, last_uses):
+            fh = stack.enter_context(open(dim.output_file, "w"))
+            dim.write_header(fh)
+            outputs.append((dim, fh, last_use))
 
-        fh.write("\n")
+        for i, item in enumerate(items):
+            for dim, fh, last_use in outputs:
+                dim.write_item(fh, item, i, last_use)
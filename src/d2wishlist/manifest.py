@@ -1,21 +1,195 @@
 #!/usr/bin/env python3
 
 import json
+import os
 import sqlite3
-from functools import lru_cache
+import threading
+from bisect import bisect_left
+from typing import NamedTuple
+
+from d2wishlist import sidecar
+from d2wishlist.cache import DEFAULT_MAXSIZE, DefinitionCache
+from d2wishlist.stats import stats
+
+MANIFEST_PATH = "manifest.sqlite3"
+
+# Memory-map the whole manifest (~200MB) and give each connection a 64MB page cache
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+
+
+class Manifest(object):
+    """
+    A handle on the manifest database.
+
+    Nothing is opened until the first query. Each thread (and each process, in
+    case of a fork) gets its own read-only connection, with the indexed
+    sidecar attached as "idx" once it's been asked for.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        mmap_size: int = MMAP_SIZE,
+        cache_size_kib: int = CACHE_SIZE_KIB,
+    ):
+        self.path = path or os.environ.get("D2WISHLIST_MANIFEST", MANIFEST_PATH)
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._version = None
+        self._sidecar_path = None
+        self._plug_hashes = None
+        self._name_index = None
+        self._plugs = dict()
+
+    def __repr__(self):
+        return f"Manifest({self.path!r})"
+
+    def version(self) -> str:
+        if self._version is None:
+            self._version = manifest_version(self.path)
+        return self._version
+
+    def connection(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Manifest not found at {self.path}")
+            conn = sqlite3.connect(sidecar.uri(self.path, "ro"), uri=True)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+            local.conn = conn
+            local.pid = os.getpid()
+            local.sidecar_attached = False
+        return local.conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        return self.connection().cursor()
+
+    def index_cursor(self) -> sqlite3.Cursor:
+        """Returns a cursor with the indexed sidecar attached as "idx", building it if needed."""
+        conn = self.connection()
+        if not self._local.sidecar_attached:
+            with self._lock:
+                if self._sidecar_path is None:
+                    self._sidecar_path = sidecar.ensure(
+                        self.path, self.version(), SOCKET_OVERRIDES
+                    )
+            conn.execute(
+                "ATTACH DATABASE ? AS idx", (sidecar.uri(self._sidecar_path, "ro"),)
+            )
+            self._local.sidecar_attached = True
+        return conn.cursor()
+
+    def plug_hashes(self) -> frozenset:
+        """Returns the hashes (as strings) of every plug item in the manifest."""
+        if self._plug_hashes is None:
+            r = self.index_cursor().execute(
+                "SELECT hash FROM idx.items WHERE is_plug = 1"
+            )
+            self._plug_hashes = frozenset(str(row[0]) for row in r)
+        return self._plug_hashes
+
+    def name_index(self) -> "NameIndex":
+        """Returns the name index of every non-dummy item, building it on first use."""
+        if self._name_index is None:
+            r = self.index_cursor().execute(
+                """
+                SELECT
+                  bucket_type_hash, name, id, hash
+                FROM
+                  idx.items
+                WHERE
+                  is_dummy = 0
+                  AND name IS NOT NULL
+                """
+            )
+            with stats.phase("manifest.name_index"):
+                index = NameIndex(r)
+            with self._lock:
+                if self._name_index is None:
+                    self._name_index = index
+        return self._name_index
+
+    def plug(self, hash) -> "PlugRef":
+        """Returns the PlugRef for plug item hash, of which there's one per process."""
+        hash = int(hash)
+        ref = self._plugs.get(hash)
+        if ref is None:
+            projection = query_item(hash)
+            ref = PlugRef(hash, projection.name, projection.tierType)
+            ref = self._plugs.setdefault(hash, ref)
+        return ref
+
+    def intern_plug(self, hash, name, tierType) -> "PlugRef":
+        """Returns the interned PlugRef for hash, adopting the one given if there's none yet."""
+        hash = int(hash)
+        ref = self._plugs.get(hash)
+        if ref is None:
+            ref = self._plugs.setdefault(hash, PlugRef(hash, name, tierType))
+        return ref
+
+
+class NameIndex(object):
+    """
+    Casefolded item names, sorted per inventory bucket, for finding every item
+    whose name starts with another's by binary search.
+    """
+
+    def __init__(self, rows):
+        buckets = dict()
+        for bucket, name, id, hash in rows:
+            buckets.setdefault(bucket, []).append((name, id, hash))
+
+        self._buckets = dict()
+        for bucket, entries in buckets.items():
+            entries.sort()
+            self._buckets[bucket] = ([e[0] for e in entries], entries)
+
+    def starting_with(self, bucket: int, prefix: str) -> list[tuple[int, int]]:
+        """Returns the (id, hash) of each item in bucket named prefix or longer, by id."""
+        names, entries = self._buckets.get(bucket, ((), ()))
+        found = []
+        for i in range(bisect_left(names, prefix), len(names)):
+            if not names[i].startswith(prefix):
+                break
+            found.append(entries[i][1:])
+        found.sort()
+        return found
+
+
+manifest = Manifest()
+
+
+def configure(path: str = None):
+    """
+    Points the module-level manifest handle at path.
+
+    Passing None falls back to $D2WISHLIST_MANIFEST or manifest.sqlite3. Worker
+    processes call this on startup so they open their own connections.
+    """
+    global manifest
+    manifest = Manifest(path)
 
-manifest = sqlite3.connect("manifest.sqlite3")
 
 # Table names
 INVITEMDEF = "DestinyInventoryItemDefinition"
 PLUGSETDEF = "DestinyPlugSetDefinition"
+COLLECTIBLEDEF = "DestinyCollectibleDefinition"
+
+# Definition cache "tables" for projected item fields and perk sockets from the
+# sidecar, kept apart from full definitions
+ITEMPROJECTION = f"{INVITEMDEF}.projection"
+SOCKETS = f"{INVITEMDEF}.sockets"
 
-# socketCategories[].socketCategoryHash for weapon perks
-WEAPON_PERKS = 4241085061
-ARMOR_PERKS = 2518356196
+# Number of hashes to look up per "WHERE id IN (...)" query when prefetching
+PREFETCH_CHUNK_SIZE = 500
 
 # Some items, like Exotic Class Items, don't have a plug set in the manifest to define
-# the available options, so we can specify them here to override the manifest
+# the available options, so we can specify them here to override the manifest.
+# They're merged into the sidecar's socket graph when it's built.
 # SOCKET_OVERRIDES[itemHash][socket][perkHash]
 SOCKET_OVERRIDES = {
     # Stoicism
@@ -90,61 +264,263 @@ SOCKET_OVERRIDES = {
 }
 
 
-@lru_cache(maxsize=128)
+definitions = DefinitionCache()
+
+
+def configure_cache(maxsize: int = DEFAULT_MAXSIZE, cache_dir: str = None):
+    """
+    Replaces the decoded-definition cache with one of the given size.
+
+    If cache_dir is given, decoded definitions are also persisted there in a
+    database per manifest version. Perk sockets come from the sidecar, so the
+    file is also keyed by its schema version and the SOCKET_OVERRIDES
+    applied to it.
+    """
+    global definitions
+    path = None
+    if cache_dir:
+        version = manifest.version()
+        sockets = sidecar.overrides_digest(SOCKET_OVERRIDES)[:16]
+        path = os.path.join(
+            cache_dir,
+            f"definitions-{version}-{sidecar.SCHEMA_VERSION}-{sockets}.sqlite3",
+        )
+    definitions = DefinitionCache(maxsize, path)
+
+
 def query_manifest(table, hash):
-    id = sql_id(hash)
+    definition = definitions.get(table, hash)
+    if definition is not None:
+        return definition
+
+    stats.count(f"manifest.queries.{table}")
+    with stats.phase("manifest.query"):
+        id = sql_id(hash)
+        c = manifest.cursor()
+        r = c.execute(f"SELECT json FROM {table} WHERE id = ?", (id,))
+        row = r.fetchone()
+        if not row:
+            raise LookupError(f"No {table} for {hash}")
+        definition = json.loads(row[0])
+    definitions.put(table, hash, definition)
+    return definition
+
+
+class ItemProjection(NamedTuple):
+    """The fields of an item definition the wishlist tools use."""
+
+    name: str | None
+    tierType: int | None
+    bucketTypeHash: int | None
+    iconWatermark: str | None
+    collectibleHash: int | None
+
+
+# Extracts ItemProjection's fields without decoding the rest of the definition
+ITEM_PROJECTION = f"""
+SELECT
+  id,
+  json_extract(json, "$.displayProperties.name"),
+  json_extract(json, "$.inventory.tierType"),
+  json_extract(json, "$.inventory.bucketTypeHash"),
+  json_extract(json, "$.iconWatermark"),
+  json_extract(json, "$.collectibleHash")
+FROM
+  {INVITEMDEF}
+WHERE
+  id IN ({{}})
+"""
+
+
+def query_item(hash) -> ItemProjection:
+    projection = definitions.get(ITEMPROJECTION, hash)
+    if projection is not None:
+        return projection
+
+    stats.count(f"manifest.queries.{ITEMPROJECTION}")
+    with stats.phase("manifest.query"):
+        c = manifest.cursor()
+        r = c.execute(ITEM_PROJECTION.format("?"), (sql_id(hash),))
+        row = r.fetchone()
+        if not row:
+            raise LookupError(f"No {INVITEMDEF} for {hash}")
+        projection = ItemProjection(*row[1:])
+    definitions.put(ITEMPROJECTION, hash, projection)
+    return projection
+
+
+def _chunks(table, hashes):
+    """Splits hashes into chunks of SQL ids for batched "WHERE id IN (...)" queries."""
+    ids = sorted({sql_id(h) for h in hashes})
+    for i in range(0, len(ids), PREFETCH_CHUNK_SIZE):
+        stats.count(f"manifest.queries.{table}")
+        yield ids[i : i + PREFETCH_CHUNK_SIZE]
+
+
+def prefetch_projections(hashes):
+    """
+    Loads the projected fields of the items in hashes into the cache using
+    batched queries.
+
+    Hashes that are already cached are skipped, and hashes that don't exist in
+    the manifest are ignored here and left for query_item to report.
+    """
+    c = manifest.cursor()
+    hashes = definitions.missing(ITEMPROJECTION, hashes)
+    for chunk in _chunks(ITEMPROJECTION, hashes):
+        r = c.execute(ITEM_PROJECTION.format(",".join("?" * len(chunk))), chunk)
+        for id, *fields in r:
+            projection = ItemProjection(*fields)
+            definitions.put(ITEMPROJECTION, id & 0xFFFFFFFF, projection)
+
+
+# Reads items' perk sockets out of the sidecar's socket graph, in order. Items
+# without perk sockets get a single row of NULLs.
+SOCKET_GRAPH = """
+SELECT
+  items.hash,
+  items.perk_sockets,
+  sockets.socket_index,
+  sockets.perk_hash,
+  sockets.perk_name,
+  sockets.tier
+FROM
+  idx.items
+  LEFT JOIN idx.sockets ON sockets.item_hash = items.hash
+WHERE
+  items.id IN ({})
+ORDER BY
+  items.id,
+  sockets.socket_index,
+  sockets.position
+"""
+
+
+def _socket_rows(rows) -> dict[int, tuple]:
+    """
+    Groups SOCKET_GRAPH rows into a tuple of (perk hash, name, tierType)
+    tuples per perk socket, by item hash.
+    """
+    grouped = dict()
+    for hash, perk_sockets, socket_index, perk_hash, name, tier in rows:
+        if hash not in grouped:
+            grouped[hash] = [[] for _ in range(perk_sockets or 0)]
+        if socket_index is not None:
+            grouped[hash][socket_index].append((perk_hash, name, tier))
+    return {
+        hash: tuple(tuple(socket) for socket in sockets)
+        for hash, sockets in grouped.items()
+    }
+
+
+def query_sockets(hash) -> tuple:
+    """
+    Returns the perks each of item hash's perk sockets can roll, as tuples of
+    (perk hash, name, tierType), with one indexed range query on the sidecar.
+    """
+    sockets = definitions.get(SOCKETS, hash)
+    if sockets is not None:
+        return sockets
+
+    stats.count(f"manifest.queries.{SOCKETS}")
+    with stats.phase("manifest.query"):
+        c = manifest.index_cursor()
+        r = c.execute(SOCKET_GRAPH.format("?"), (sql_id(hash),))
+        sockets = _socket_rows(r).get(int(hash), ())
+    definitions.put(SOCKETS, hash, sockets)
+    return sockets
+
+
+def prefetch_sockets(hashes):
+    """Loads the perk sockets of the items in hashes into the cache, in batches."""
+    c = manifest.index_cursor()
+    hashes = definitions.missing(SOCKETS, hashes)
+    for chunk in _chunks(SOCKETS, hashes):
+        r = c.execute(SOCKET_GRAPH.format(",".join("?" * len(chunk))), chunk)
+        for hash, sockets in _socket_rows(r).items():
+            definitions.put(SOCKETS, hash, sockets)
+
+
+@stats.timed("manifest.prefetch")
+def prefetch_items(hashes):
+    """Prefetches the projected fields and perk sockets of the items in hashes."""
+    hashes = set(int(h) for h in hashes)
+    prefetch_projections(hashes)
+    prefetch_sockets(hashes)
+
+
+def collectible_sources(hashes) -> dict[int, int]:
+    """
+    Looks up the sourceHash of each collectible in hashes, without decoding
+    the rest of their definitions.
+    """
+    sources = dict()
     c = manifest.cursor()
-    r = c.execute(f"SELECT json FROM {table} WHERE id = ?", (id,))
-    row = r.fetchone()
-    if not row:
-        raise LookupError(f"No {table} for {hash}")
-    return json.loads(row[0])
+    for chunk in _chunks(COLLECTIBLEDEF, hashes):
+        placeholders = ",".join("?" * len(chunk))
+        r = c.execute(
+            f"""
+            SELECT id, json_extract(json, "$.sourceHash")
+            FROM {COLLECTIBLEDEF}
+            WHERE id IN ({placeholders})
+            """,
+            chunk,
+        )
+        for id, source in r:
+            sources[id & 0xFFFFFFFF] = source
+    return sources
+
+
+def manifest_version(path: str = MANIFEST_PATH) -> str:
+    """
+    Returns an identifier for the manifest at path.
+
+    If a version file was saved alongside the manifest (manifest.sqlite3.version)
+    its contents are used, otherwise the file size and modification time stand in.
+    """
+    try:
+        with open(f"{path}.version") as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        st = os.stat(path)
+        return f"{st.st_size}-{st.st_mtime_ns}"
 
 
 def weapons_by_watermark(watermark: str) -> list:
-    c = manifest.cursor()
+    c = manifest.index_cursor()
     r = c.execute(
         """
         SELECT
-          json_extract(item.json, "$.hash")
+          hash
         FROM
-          DestinyInventoryItemDefinition AS item
+          idx.items
         WHERE
-          json_extract(item.json, "$.iconWatermark") = ?
-          AND json_extract(item.json, "$.itemType") = 3
+          icon_watermark = ?
+          AND item_type = 3
+        ORDER BY
+          id
         """,
         (watermark,),
     )
     return r.fetchall()
 
 
-def find_duplicates(item: object) -> list:
-    c = manifest.cursor()
-    r = c.execute(
-        """
-        SELECT
-          json_extract(item.json, "$.hash")
-        FROM
-          DestinyInventoryItemDefinition AS item
-        WHERE
-          id != ?
-          AND json_extract(item.json, "$.displayProperties.name") LIKE ?
-          AND json_extract(item.json, "$.inventory.bucketTypeHash") = ?
-          AND NOT EXISTS (
-            SELECT *
-            FROM
-              json_each(json_extract(item.json, "$.itemCategoryHashes"))
-            WHERE
-              json_each.value = 3109687656
-          )
-        """,
-        (
-            sql_id(item.hash),
-            f"{item.name}%",
-            item.definition["inventory"]["bucketTypeHash"],
-        ),
+@stats.timed("manifest.find_duplicates")
+def find_duplicates(item: object, hash=None) -> list:
+    """
+    Returns the hashes, as 1-tuples, of the other non-dummy items in item's
+    bucket whose names start with its name, such as its Adept, Timelost or
+    reissued versions, in manifest order.
+
+    item can be an ItemProjection, which doesn't carry its hash, as long as
+    hash is given.
+    """
+    if hash is None:
+        hash = item.hash
+    matches = manifest.name_index().starting_with(
+        item.bucketTypeHash, item.name.casefold()
     )
-    return r.fetchall()
+    return [(match,) for _, match in matches if match != int(hash)]
 
 
 def sql_id(hash):
@@ -158,16 +534,46 @@ class LookupError(Exception):
     pass
 
 
-class PlugSet(object):
-    def __init__(self, hash):
+class PlugRef(object):
+    """
+    A lightweight reference to a plug item in an item's socket.
+
+    Only the fields needed to match and write out perks are kept, and the full
+    InventoryItem is loaded the first time anything else is asked for.
+    """
+
+    __slots__ = ("hash", "name", "tierType", "_item")
+
+    def __init__(self, hash, name, tierType):
         self.hash = str(hash)
-        self.definition = query_manifest(PLUGSETDEF, hash)
+        self.name = name
+        self.tierType = tierType
+        self._item = None
+
+    def __str__(self):
+        return f"{self.name} [{self.hash}]"
+
+    def __repr__(self):
+        return f"{self.name} [{self.hash}]"
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.item, name)
+
+    def __reduce__(self):
+        # Unpickle to the receiving process' interned PlugRef, if it has one
+        return (_intern_plug, (self.hash, self.name, self.tierType))
 
-    def reusable_plug_items(self):
-        return [
-            InventoryItem(p["plugItemHash"])
-            for p in self.definition["reusablePlugItems"]
-        ]
+    @property
+    def item(self):
+        if self._item is None:
+            self._item = InventoryItem(self.hash)
+        return self._item
+
+
+def _intern_plug(hash, name, tierType):
+    return manifest.intern_plug(hash, name, tierType)
 
 
 class ManifestObject(object):
@@ -184,20 +590,70 @@ class ManifestObject(object):
         return f"{self.name} [{self.hash}]"
 
     def __getattr__(self, name):
+        # Keep pickle and copy from recursing into a missing definition
+        if name.startswith("__") or name == "definition":
+            raise AttributeError(name)
         return self.definition[name]
 
 
 class Collectible(ManifestObject):
-    _table = "DestinyCollectibleDefinition"
+    _table = COLLECTIBLEDEF
 
 
 class InventoryItem(object):
+    """
+    An inventory item, with its perk sockets and the handful of fields the
+    wishlist tools use projected out of its definition.
+
+    The full definition is only loaded when it, or any other field of it, is
+    asked for.
+    """
+
+    __slots__ = (
+        "hash",
+        "name",
+        "tierType",
+        "bucketTypeHash",
+        "iconWatermark",
+        "collectibleHash",
+        "sockets",
+        "perk_sockets",
+        "perk_names",
+        "_definition",
+    )
+
     def __init__(self, hash):
         self.hash = str(hash)
-        self.definition = query_manifest(INVITEMDEF, hash)
-        self.name = self.definition["displayProperties"]["name"]
+        projection = query_item(hash)
+        self.name = projection.name
+        self.tierType = projection.tierType
+        self.bucketTypeHash = projection.bucketTypeHash
+        self.iconWatermark = projection.iconWatermark
+        self.collectibleHash = projection.collectibleHash
+        self._definition = None
         self.sockets = []
-        self.load_sockets()
+        self.load_sockets(query_sockets(hash))
+        self.perk_sockets = self.index_perk_sockets()
+        self.perk_names = self.index_perk_names()
+
+    @property
+    def definition(self) -> dict:
+        if self._definition is None:
+            self._definition = query_manifest(INVITEMDEF, self.hash)
+        return self._definition
+
+    def __getstate__(self):
+        # Leave the full definition behind, it's loaded again if it's needed
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name != "_definition"
+        }
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._definition = None
 
     def __str__(self):
         return f"{self.name} [{self.hash}]"
@@ -206,6 +662,10 @@ class InventoryItem(object):
         return f"{self.name} [{self.hash}]"
 
     def __getattr__(self, name):
+        # Only fields that weren't projected get here. Keep pickle and copy
+        # from recursing into a missing definition.
+        if name.startswith("_") or name in self.__slots__ or name == "definition":
+            raise AttributeError(name)
         return self.definition[name]
 
     def pprint(self):
@@ -215,56 +675,40 @@ class InventoryItem(object):
             for perk in s:
                 print(f"    - {s[perk]}")
 
+    def index_perk_sockets(self):
+        """Maps each perk hash to the indexes of the sockets it can roll in."""
+        perk_sockets = dict()
+        for i, socket in enumerate(self.sockets):
+            for perk in socket:
+                perk_sockets[perk] = perk_sockets.get(perk, ()) + (i,)
+        return perk_sockets
+
+    def index_perk_names(self):
+        """
+        Maps each casefolded perk name to the plug with that name in each
+        socket it can roll in, by socket index.
+        """
+        perk_names = dict()
+        for i, socket in enumerate(self.sockets):
+            for plug in socket.values():
+                perk_names.setdefault(plug.name.casefold(), dict())[i] = plug
+        return perk_names
+
     def collectible(self):
-        if "collectibleHash" not in self.definition:
+        if self.collectibleHash is None:
             return None
 
         return Collectible(self.collectibleHash)
 
-    def load_sockets(self):
-        if "sockets" not in self.definition:
-            return
-
-        # Load override perks if available
-        if int(self.hash) in SOCKET_OVERRIDES:
-            sockets = SOCKET_OVERRIDES[int(self.hash)]
-            for s in sockets:
-                plugs = dict()
-                for perk in sockets[s]:
-                    plugitem = InventoryItem(perk)
-                    plugs[plugitem.hash] = plugitem
-                self.sockets.append(plugs)
-            return
-
-        # Find sockets for weapon perks
-        socket_indexes = [
-            s["socketIndexes"]
-            for s in self.definition["sockets"]["socketCategories"]
-            if s["socketCategoryHash"] in (WEAPON_PERKS, ARMOR_PERKS)
-        ][0]
-        for i in socket_indexes:
-            plugs = dict()
-            entry = self.definition["sockets"]["socketEntries"][i]
-
-            # plug options specified directly in the item definition
-            for plug in entry["reusablePlugItems"]:
-                plugitem = InventoryItem(plug["plugItemHash"])
-                plugs[plugitem.hash] = plugitem
-
-            # plug options specified via plug sets (either randomized or reusable)
-            plug_type = None
-            for t in ("randomizedPlugSetHash", "reusablePlugSetHash"):
-                if t in entry:
-                    plug_type = t
-                    break
-
-            if plug_type:
-                plugset = PlugSet(entry[plug_type])
-                for plugitem in plugset.reusable_plug_items():
-                    plugs[plugitem.hash] = plugitem
-
-            # Filter for tierType 2 (Common) perks only, to avoid pulling
-            # in all the enhanced versions.
-            plugs = {p: plugs[p] for p in plugs if plugs[p].inventory["tierType"] == 2}
-
-            self.sockets.append(plugs)
+    def load_sockets(self, sockets):
+        """
+        Fills in self.sockets from the socket graph, with SOCKET_OVERRIDES and
+        the Common perk filtering already applied when the sidecar was built.
+        """
+        for perks in sockets:
+            self.sockets.append(
+                {
+                    str(hash): manifest.intern_plug(hash, name, tierType)
+                    for hash, name, tierType in perks
+                }
+            )
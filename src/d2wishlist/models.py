@@ -1,10 +1,15 @@
+import difflib
+import hashlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from typing import Optional
 
-from pydantic import BaseModel, PrivateAttr, model_validator
+from pydantic import BaseModel, PrivateAttr
 from typing_extensions import Self
 
 import d2wishlist.dim_additional as dim_additional
 import d2wishlist.manifest as manifest
+from d2wishlist.stats import stats
 
 
 class Roll(BaseModel):
@@ -14,6 +19,7 @@ class Roll(BaseModel):
     text: str
     _perk_items: list = PrivateAttr(default_factory=list)
 
+    @stats.timed("roll.validate_perks")
     def validate_perks(self, inv_item: manifest.InventoryItem) -> Self:
         """
         Loads the Destiny Manifest definitions for this roll's perks and
@@ -24,36 +30,43 @@ class Roll(BaseModel):
             # item definition, so let's use the first perk to find the
             # matching socket, then match the rest of the perks against
             # that.
-            perk_set_socket = None
-            for socket in inv_item.sockets:
-                for socket_item in socket.values():
-                    if socket_item.name.casefold() == perk_set[0].casefold():
-                        perk_set_socket = socket
-                        break
-                if perk_set_socket:
-                    break
-            if not perk_set_socket:
+            first = perk_set[0].casefold()
+            sockets = inv_item.perk_names.get(first)
+            if not sockets:
                 raise LookupError(
-                    f"Could not find '{perk_set[0].casefold()}' on {inv_item}"
+                    f"Could not find '{first}' on {inv_item}"
+                    + suggest(first, inv_item.perk_names)
                 )
+            perk_set_socket = next(iter(sockets))
 
-            perk_item_map = {
-                perk_set_socket[p].name.casefold(): perk_set_socket[p]
-                for p in perk_set_socket
-            }
             perk_set_items = []
             for perk in perk_set:
-                try:
-                    perk_set_items.append(perk_item_map[perk.casefold()])
-                except KeyError:
+                plug = inv_item.perk_names.get(perk.casefold(), {}).get(perk_set_socket)
+                if plug is None:
+                    names = list(
+                        dict.fromkeys(
+                            p.name.casefold()
+                            for p in inv_item.sockets[perk_set_socket].values()
+                        )
+                    )
                     raise LookupError(
-                        f"Could not find '{perk.casefold()}' on {inv_item} socket: {perk_item_map.keys()}"
+                        f"Could not find '{perk.casefold()}' on {inv_item} socket: {names}"
+                        + suggest(perk.casefold(), names)
                     )
+                perk_set_items.append(plug)
             self._perk_items.append(perk_set_items)
 
         return self
 
 
+def suggest(name: str, candidates) -> str:
+    """Returns a hint naming the closest matches to name among candidates, if any."""
+    matches = difflib.get_close_matches(name, candidates, n=3)
+    if not matches:
+        return ""
+    return " (did you mean " + " or ".join(f"'{m}'" for m in matches) + "?)"
+
+
 class Item(BaseModel):
     name: str
     hash: int | list[int]
@@ -61,33 +74,64 @@ class Item(BaseModel):
     season: Optional[int] = None
     _inventory_item: manifest.InventoryItem
     _variants: list = PrivateAttr(default_factory=list)
+    # The season given in the wishlist, or else the primary item's
+    _season: Optional[int] = PrivateAttr(default=None)
+    _source_digest: Optional[str] = PrivateAttr(default=None)
 
-    @model_validator(mode="after")
-    def validate_inventory_item(self) -> Self:
-        """Loads the Destiny Manifest definition for this item and checks the rolls for valid perks."""
-        # if hash was given a list, convert the first one to our hash
-        # and make the rest into variants
+    def source_digest(self) -> str:
+        """
+        Returns a digest of this item as it was written in the wishlist.
+
+        Resolving only fills in private attributes, so it's the same before
+        and after.
+        """
+        if self._source_digest is None:
+            self._source_digest = hashlib.sha256(
+                self.model_dump_json().encode()
+            ).hexdigest()
+        return self._source_digest
+
+    def hashes(self) -> list[int]:
+        """Returns the primary hash followed by any variant hashes given for this item."""
         if isinstance(self.hash, list):
-            primary = self.hash[0]
-            for variant in self.hash[1:]:
-                item = manifest.InventoryItem(variant)
-                self._variants.append(item)
-            self.hash = primary
+            return list(self.hash)
+        return [self.hash]
+
+    def load_inventory_items(self) -> Self:
+        """Loads the Destiny Manifest definitions for this item and its listed variants."""
+        # if hash was given a list, the first one is our hash and the rest
+        # are variants
+        primary, *variants = self.hashes()
+        for variant in variants:
+            item = manifest.InventoryItem(variant)
+            self._variants.append(item)
+
+        self._inventory_item = manifest.InventoryItem(primary)
 
-        self._inventory_item = manifest.InventoryItem(self.hash)
+        return self
+
+    def resolve(self) -> Self:
+        """Loads the Destiny Manifest definition for this item and checks the rolls for valid perks."""
+        if not hasattr(self, "_inventory_item"):
+            self.load_inventory_items()
+        stats.count("items")
+        stats.count("rolls", len(self.rolls))
 
         for roll in self.rolls:
             roll.validate_perks(self._inventory_item)
 
-        if not self.season:
-            self.season = dim_additional.get_season(self._inventory_item)
+        dupes = [
+            manifest.InventoryItem(item_hash[0])
+            for item_hash in manifest.find_duplicates(self._inventory_item)
+        ]
+        seasons = dim_additional.get_seasons([self._inventory_item] + dupes)
 
-        dupe_hashes = manifest.find_duplicates(self._inventory_item)
-        for item_hash in dupe_hashes:
-            item_hash = item_hash[0]
-            item = manifest.InventoryItem(item_hash)
-            season = dim_additional.get_season(item)
-            if self.season == season:
+        self._season = self.season
+        if not self._season:
+            self._season = seasons[int(self._inventory_item.hash)]
+
+        for item in dupes:
+            if self._season == seasons[int(item.hash)]:
                 self._variants.append(item)
 
         return self
@@ -98,3 +142,113 @@ class Wishlist(BaseModel):
     description: str
     author: str
     wishlist: list[Item]
+
+    def prefetch(self, items: list[Item] = None):
+        """
+        Loads everything reachable from items (by default the whole wishlist)
+        into the definition cache.
+
+        Items, variants and their plug sets, plugs and collectibles are fetched
+        with a handful of batched queries, so resolving each item afterwards
+        only reads from the cache.
+        """
+        if items is None:
+            items = self.wishlist
+        prefetch(items)
+
+    def resolve(self, jobs: int = 1, items: list[Item] = None) -> Self:
+        """
+        Resolves items (by default the whole wishlist) against the Destiny
+        Manifest.
+
+        With jobs > 1 items are resolved across that many worker processes,
+        each with its own read-only manifest connection, and put back in their
+        original order.
+        """
+        if items is None:
+            items = self.wishlist
+        if not items:
+            return self
+
+        self.prefetch(items)
+
+        if jobs <= 1:
+            for item in items:
+                item.resolve()
+            return self
+
+        chunksize = max(1, len(items) // (jobs * 4))
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(manifest.manifest.path, dim_additional.resolver.path),
+        ) as pool:
+            resolved = pool.map(_resolve_item, items, chunksize=chunksize)
+            resolved = {id(item): r for item, r in zip(items, resolved)}
+        self.wishlist = [resolved.get(id(item), item) for item in self.wishlist]
+
+        return self
+
+
+def prefetch(items: list[Item]):
+    """Loads everything reachable from items into the definition cache."""
+    manifest.prefetch_items(h for item in items for h in item.hashes())
+    primaries = [item.hashes()[0] for item in items]
+    manifest.prefetch_items(
+        dupe[0]
+        for hash in primaries
+        for dupe in manifest.find_duplicates(manifest.query_item(hash), hash)
+    )
+
+
+def iter_resolve(items, jobs: int = 1, skip=None):
+    """
+    Resolves items from an iterable as they arrive, yielding them in order.
+
+    Items for which skip(item) is true are passed through unresolved. With
+    jobs > 1 no more than jobs * 2 items are in flight at once, so memory use
+    doesn't grow with the number of items.
+    """
+    if jobs <= 1:
+        for item in items:
+            if not (skip and skip(item)):
+                _resolve_item(item)
+            yield item
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(manifest.manifest.path, dim_additional.resolver.path),
+    ) as pool:
+        pending = deque()
+        for item in items:
+            if skip and skip(item):
+                pending.append(item)
+            else:
+                pending.append(pool.submit(_resolve_item, item))
+            while len(pending) > jobs * 2:
+                yield _pending_result(pending.popleft())
+        while pending:
+            yield _pending_result(pending.popleft())
+
+
+def _init_worker(manifest_path: str, additional_info_path: str):
+    # Forked workers inherit the handle, indexes and season data the parent
+    # just warmed up (opening their own connections on first use), so they're
+    # only replaced when the worker starts out pointed elsewhere, as with spawn
+    if manifest.manifest.path != manifest_path:
+        manifest.configure(manifest_path)
+    if dim_additional.resolver.path != additional_info_path:
+        dim_additional.configure(additional_info_path)
+
+
+def _pending_result(pending):
+    if isinstance(pending, Future):
+        return pending.result()
+    return pending
+
+
+def _resolve_item(item: Item) -> Item:
+    prefetch([item])
+    return item.resolve()
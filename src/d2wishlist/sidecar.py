@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from urllib.request import pathname2url
+
+# Bump this whenever the sidecar tables change so existing files get rebuilt
+SCHEMA_VERSION = 3
+
+# itemCategoryHashes entry for dummy items, which share names with real weapons
+DUMMY_CATEGORY = 3109687656
+
+# socketCategories[].socketCategoryHash for weapon perks
+WEAPON_PERKS = 4241085061
+ARMOR_PERKS = 2518356196
+
+# Plugs are only kept in the socket graph if they're this tierType (Common),
+# to avoid pulling in all the enhanced versions
+COMMON_TIER = 2
+
+SCHEMA = """
+CREATE TABLE meta (
+  key TEXT PRIMARY KEY NOT NULL,
+  value TEXT
+);
+
+CREATE TABLE items (
+  id INTEGER PRIMARY KEY NOT NULL,
+  hash INTEGER NOT NULL,
+  name TEXT,
+  bucket_type_hash INTEGER,
+  item_type INTEGER,
+  icon_watermark TEXT,
+  is_dummy INTEGER NOT NULL,
+  is_plug INTEGER NOT NULL,
+  collectible_hash INTEGER,
+  perk_sockets INTEGER
+);
+
+CREATE TABLE sockets (
+  item_hash INTEGER NOT NULL,
+  socket_index INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  perk_hash INTEGER NOT NULL,
+  perk_name TEXT,
+  tier INTEGER,
+  PRIMARY KEY (item_hash, socket_index, position)
+) WITHOUT ROWID;
+
+CREATE INDEX items_bucket_name ON items (bucket_type_hash, name) WHERE is_dummy = 0;
+CREATE INDEX items_watermark ON items (icon_watermark, item_type);
+CREATE INDEX items_collectible ON items (collectible_hash);
+CREATE INDEX items_plug ON items (hash) WHERE is_plug = 1;
+"""
+
+POPULATE = f"""
+INSERT INTO items
+SELECT
+  item.id,
+  json_extract(item.json, "$.hash"),
+  casefold(json_extract(item.json, "$.displayProperties.name")),
+  json_extract(item.json, "$.inventory.bucketTypeHash"),
+  json_extract(item.json, "$.itemType"),
+  json_extract(item.json, "$.iconWatermark"),
+  EXISTS (
+    SELECT *
+    FROM
+      json_each(json_extract(item.json, "$.itemCategoryHashes"))
+    WHERE
+      json_each.value = {DUMMY_CATEGORY}
+  ),
+  json_type(item.json, "$.plug") IS NOT NULL,
+  json_extract(item.json, "$.collectibleHash"),
+  NULL
+FROM
+  manifest.DestinyInventoryItemDefinition AS item
+"""
+
+RAW_SOCKETS = """
+CREATE TEMP TABLE raw_sockets (
+  item_hash INTEGER NOT NULL,
+  socket_index INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  perk_id INTEGER NOT NULL,
+  is_override INTEGER NOT NULL
+)
+"""
+
+# Names the plugs of each socket, keeping only the first of any repeats and
+# (unless they're overrides) only Common ones
+POPULATE_SOCKETS = f"""
+INSERT INTO sockets
+SELECT
+  raw.item_hash,
+  raw.socket_index,
+  MIN(raw.position),
+  json_extract(plug.json, "$.hash"),
+  json_extract(plug.json, "$.displayProperties.name"),
+  json_extract(plug.json, "$.inventory.tierType")
+FROM
+  temp.raw_sockets AS raw
+  JOIN manifest.DestinyInventoryItemDefinition AS plug ON plug.id = raw.perk_id
+WHERE
+  raw.is_override
+  OR json_extract(plug.json, "$.inventory.tierType") = {COMMON_TIER}
+GROUP BY
+  raw.item_hash,
+  raw.socket_index,
+  raw.perk_id
+"""
+
+
+def sidecar_path(manifest_path: str) -> str:
+    """Returns the path of the index sidecar that belongs to manifest_path."""
+    root, ext = os.path.splitext(manifest_path)
+    return f"{root}.index{ext or '.sqlite3'}"
+
+
+def uri(path: str, mode: str) -> str:
+    """Builds a SQLite URI filename for path, opened with the given mode."""
+    return f"file:{pathname2url(os.path.abspath(path))}?mode={mode}"
+
+
+def perk_socket_layout(sockets: dict) -> tuple[tuple[tuple[int, ...], int | None], ...]:
+    """
+    Returns the plug hashes listed directly on each weapon or armor perk socket
+    in sockets, along with the randomized or reusable plug set it draws the
+    rest from, if any.
+    """
+    socket_indexes = [
+        s["socketIndexes"]
+        for s in sockets["socketCategories"]
+        if s["socketCategoryHash"] in (WEAPON_PERKS, ARMOR_PERKS)
+    ]
+    layout = []
+    for i in socket_indexes[0] if socket_indexes else ():
+        entry = sockets["socketEntries"][i]
+        plugs = tuple(plug["plugItemHash"] for plug in entry["reusablePlugItems"])
+        plugset = None
+        for t in ("randomizedPlugSetHash", "reusablePlugSetHash"):
+            if t in entry:
+                plugset = entry[t]
+                break
+        layout.append((plugs, plugset))
+    return tuple(layout)
+
+
+def overrides_digest(socket_overrides: dict) -> str:
+    """Returns a digest of socket_overrides, so sidecars are rebuilt when they change."""
+    data = json.dumps(socket_overrides or {}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _sql_id(hash: int) -> int:
+    return hash - (1 << 32) if hash & (1 << 31) else hash
+
+
+def _casefold(value):
+    if value is None:
+        return None
+    return value.casefold()
+
+
+def is_current(path: str, version: str, socket_overrides: dict = None) -> bool:
+    """Checks whether the sidecar at path was built for this manifest version and overrides."""
+    if not os.path.exists(path):
+        return False
+
+    try:
+        db = sqlite3.connect(uri(path, "ro"), uri=True)
+        try:
+            meta = dict(db.execute("SELECT key, value FROM meta").fetchall())
+        finally:
+            db.close()
+    except sqlite3.DatabaseError:
+        return False
+
+    if meta.get("schema_version") != str(SCHEMA_VERSION):
+        return False
+    if meta.get("socket_overrides") != overrides_digest(socket_overrides):
+        return False
+    return meta.get("manifest_version") == version
+
+
+def _raw_sockets(db: sqlite3.Connection, socket_overrides: dict, counts: dict):
+    """
+    Yields a raw_sockets row for every plug that can go in each item's perk
+    sockets, in order, and records how many perk sockets each item has in
+    counts. Items in socket_overrides take their plugs from there instead.
+    """
+    plugsets = dict()
+
+    def plugset_hashes(hash):
+        if hash not in plugsets:
+            row = db.execute(
+                "SELECT json FROM manifest.DestinyPlugSetDefinition WHERE id = ?",
+                (_sql_id(hash),),
+            ).fetchone()
+            plugsets[hash] = (
+                [p["plugItemHash"] for p in json.loads(row[0])["reusablePlugItems"]]
+                if row
+                else []
+            )
+        return plugsets[hash]
+
+    r = db.execute(
+        """
+        SELECT
+          id,
+          json_extract(json, "$.hash"),
+          json_extract(json, "$.sockets")
+        FROM
+          manifest.DestinyInventoryItemDefinition
+        WHERE
+          json_type(json, "$.sockets") IS NOT NULL
+        """
+    )
+    for id, item_hash, sockets in r.fetchall():
+        if item_hash in socket_overrides:
+            overrides = list(socket_overrides[item_hash].values())
+            counts[id] = len(overrides)
+            for i, perks in enumerate(overrides):
+                for position, perk in enumerate(perks):
+                    yield (item_hash, i, position, _sql_id(perk), True)
+            continue
+
+        layout = perk_socket_layout(json.loads(sockets))
+        counts[id] = len(layout)
+        for i, (plugs, plugset) in enumerate(layout):
+            perks = list(plugs)
+            if plugset is not None:
+                perks.extend(plugset_hashes(plugset))
+            for position, perk in enumerate(perks):
+                yield (item_hash, i, position, _sql_id(perk), False)
+
+
+def build(manifest_path: str, path: str, version: str, socket_overrides: dict = None):
+    """
+    Compiles the indexed sidecar for the manifest at manifest_path.
+
+    Along with the item index, this flattens the socket graph: every plug each
+    item's perk sockets can roll, from the item definition and its plug sets,
+    or from socket_overrides[itemHash][socket] for items the manifest doesn't
+    describe properly. They're passed in by d2wishlist.manifest, which can't
+    be imported from here.
+
+    The sidecar is written to a temporary file of its own and swapped into
+    place once complete, so readers never see a half-built index and builds
+    running at the same time don't clobber each other's files.
+    """
+    socket_overrides = socket_overrides or {}
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(path)),
+    )
+    os.close(fd)
+    try:
+        _populate(tmp_path, manifest_path, version, socket_overrides)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _populate(path: str, manifest_path: str, version: str, socket_overrides: dict):
+    db = sqlite3.connect(uri(path, "rwc"), uri=True)
+    try:
+        db.create_function("casefold", 1, _casefold, deterministic=True)
+        db.execute("ATTACH DATABASE ? AS manifest", (uri(manifest_path, "ro"),))
+        db.executescript(SCHEMA)
+        db.execute(POPULATE)
+
+        counts = dict()
+        db.execute(RAW_SOCKETS)
+        db.executemany(
+            "INSERT INTO temp.raw_sockets VALUES (?, ?, ?, ?, ?)",
+            _raw_sockets(db, socket_overrides, counts),
+        )
+        db.execute(POPULATE_SOCKETS)
+        db.execute("DROP TABLE temp.raw_sockets")
+        db.executemany(
+            "UPDATE items SET perk_sockets = ? WHERE id = ?",
+            ((count, id) for id, count in counts.items()),
+        )
+
+        db.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            (
+                ("manifest_version", version),
+                ("schema_version", str(SCHEMA_VERSION)),
+                ("socket_overrides", overrides_digest(socket_overrides)),
+            ),
+        )
+        db.commit()
+        db.execute("ANALYZE main")
+        db.execute("DETACH DATABASE manifest")
+    finally:
+        db.close()
+
+
+def ensure(manifest_path: str, version: str, socket_overrides: dict = None) -> str:
+    """Builds the sidecar for manifest_path if it is missing or stale, returning its path."""
+    path = sidecar_path(manifest_path)
+    if not is_current(path, version, socket_overrides):
+        # Another process may be building it too; whichever finishes last
+        # swaps in its copy, and they're the same
+        build(manifest_path, path, version, socket_overrides)
+    return path
+
+
+if __name__ == "__main__":
+    import d2wishlist.manifest as manifest
+
+    if len(sys.argv) > 1:
+        manifest.configure(sys.argv[1])
+    manifest_path = manifest.manifest.path
+    version = manifest.manifest.version()
+    print(f"Compiling index for {manifest_path} (version {version})...")
+    build(
+        manifest_path, sidecar_path(manifest_path), version, manifest.SOCKET_OVERRIDES
+    )
+    print("Done.")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import functools
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Stats(object):
+    """
+    Collects wall time per phase and named counters for a run.
+
+    Phases can nest (time spent in an inner phase also counts towards the
+    outer one), and timing the same phase repeatedly adds up the total along
+    with the number of calls. Extra sections, like cache statistics, can be
+    attached with add_section() for the report.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self.phases = dict()
+            self.calls = Counter()
+            self.counters = Counter()
+            self.sections = dict()
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.calls[name] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        """Decorator that times every call of a function as phase name."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add_time(name, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def add_section(self, name: str, values: dict):
+        self.sections[name] = values
+
+    def report(self) -> dict:
+        return {
+            "total_seconds": time.perf_counter() - self.started,
+            "phases": {
+                name: {"seconds": seconds, "calls": self.calls[name]}
+                for name, seconds in self.phases.items()
+            },
+            "counters": dict(sorted(self.counters.items())),
+            **self.sections,
+        }
+
+    def summary(self) -> str:
+        report = self.report()
+        lines = [f"Total: {report['total_seconds']:.3f}s", "", "Phases:"]
+        for name, phase in report["phases"].items():
+            lines.append(
+                f"  {name:<48} {phase['seconds']:>9.3f}s {phase['calls']:>9} calls"
+            )
+        lines.extend(["", "Counters:"])
+        for name, value in report["counters"].items():
+            lines.append(f"  {name:<48} {value:>10}")
+        for section, values in self.sections.items():
+            lines.extend(["", f"{section}:"])
+            for name, value in values.items():
+                if isinstance(value, float):
+                    value = f"{value:.3f}"
+                lines.append(f"  {name:<48} {value:>10}")
+        return "\n".join(lines)
+
+    def emit(self, profile: bool = False, json_path: str = None):
+        """Prints the summary if profile is set, and writes JSON to json_path if given."""
+        if profile:
+            print()
+            print(self.summary())
+        if json_path:
+            self.write_json(json_path)
+
+    def write_json(self, path: str):
+        with open(path, "w") as fh:
+            json.dump(self.report(), fh, indent=2)
+            fh.write("\n")
+
+
+# Process-wide collector used by the manifest, models, formatter and CLIs
+stats = Stats()
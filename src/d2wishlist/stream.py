@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+from ruamel.yaml import YAML
+from ruamel.yaml.events import (
+    DocumentStartEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    SequenceEndEvent,
+    SequenceStartEvent,
+    StreamStartEvent,
+)
+
+from d2wishlist.models import Item, Wishlist
+
+
+class WishlistStream(object):
+    """
+    Reads a YAML wishlist one wishlist: entry at a time.
+
+    The title, description and author are read up front into self.wishlist
+    (with an empty item list), so they need to come before wishlist: in the
+    file. Iterating yields each Item as soon as its entry has been parsed,
+    without holding on to any of the earlier ones.
+    """
+
+    def __init__(self, fh):
+        yaml = YAML(typ="safe", pure=True)
+        self._constructor, self._parser = yaml.get_constructor_parser(fh)
+        self._composer = yaml.composer
+
+        for event in (StreamStartEvent, DocumentStartEvent, MappingStartEvent):
+            self._expect(event)
+
+        header = dict()
+        while not self._parser.check_event(MappingEndEvent):
+            key = self._next_value()
+            if key == "wishlist":
+                self._expect(SequenceStartEvent)
+                break
+            header[key] = self._next_value()
+        else:
+            raise ValueError("No wishlist: entries found")
+
+        try:
+            self.wishlist = Wishlist.model_validate(dict(header, wishlist=[]))
+        except ValueError as e:
+            raise ValueError(
+                f"title, description and author must come before wishlist: when streaming: {e}"
+            )
+
+    def _expect(self, event_type):
+        event = self._parser.get_event()
+        if not isinstance(event, event_type):
+            raise ValueError(f"Unexpected YAML structure at {event.start_mark}")
+
+    def _next_value(self):
+        node = self._composer.compose_node(None, None)
+        return self._constructor.construct_document(node)
+
+    def __iter__(self):
+        while not self._parser.check_event(SequenceEndEvent):
+            yield Item.model_validate(self._next_value())
+        self._parser.get_event()